@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shopping_lists.metrics.MetricsMiddleware',
+    'shopping_lists.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -120,4 +122,53 @@ STATICFILES_DIRS = [
 ]
 
 LOGIN_REDIRECT_URL = '/main/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# Per-request SQL and template profiling, see shopping_lists/profiling.py
+PROFILING_ENABLED = False
+PROFILING_WINDOW = 100
+
+# Metrics for Prometheus at /metrics, see shopping_lists/metrics.py
+METRICS_ENABLED = False
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# shared directory for metrics of all gunicorn workers, None when running a single process
+METRICS_DIR = None
+METRICS_DUMP_INTERVAL = 5
+
+# Fragments of fridge_detail.html are cached by fridge version, which changes with every change of its contents
+FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# fridges with more products get a search field instead of a select with all products in forms
+PRODUCT_AUTOCOMPLETE_THRESHOLD = 50
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # memberships grant access to fridges, so removing a user from a fridge has to clear the entry for all processes
+    # (e.g. gunicorn workers): the cache is a directory shared by them, with servers on many hosts use a cache server
+    # shared by all of them instead (e.g. memcached)
+    'fridge_membership': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'fridge_membership',
+    },
+}
+
+# seconds fridge memberships are cached for
+FRIDGE_MEMBERSHIP_TIMEOUT = 5 * 60
+
+# recipe indexes are cached per recipe version of the fridge, indexes of older versions are dropped after the timeout
+RECIPE_INDEX_TIMEOUT = 60 * 60
+
+# versions of a fridge kept in the change log, clients which are further behind have to load everything again
+CHANGELOG_KEPT_VERSIONS = 1000
+
+# server-sent events keep a request open for as long as a fridge page is open, enable them only if the server
+# doesn't need a worker per open request (e.g. gunicorn with gevent workers), otherwise pages poll for changes
+EVENTS_STREAM = False
+# seconds between checks for changes of an open fridge page without server-sent events
+EVENTS_POLL_INTERVAL = 30
+# pub/sub for server-sent events of fridges, see shopping_lists.events
+EVENTS_BROKER = 'shopping_lists.events.LocalBroker'
+# seconds between keepalive comments in idle event streams
+EVENTS_KEEPALIVE = 15
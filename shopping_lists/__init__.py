@@ -0,0 +1 @@
+default_app_config = 'shopping_lists.apps.ShoppingListsConfig'
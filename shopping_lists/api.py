@@ -0,0 +1,466 @@
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import JsonResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+
+from shopping_lists import events
+from shopping_lists.bundle import build_shopping_list_bundle, delta_decode
+from shopping_lists.mixins import UserHasAccessToFridgeMixin
+from shopping_lists.models import Fridge, Product, Category, Shop, ShopAisle, Recipe, ProductInRecipe, ChangeLog
+from shopping_lists.routing import ShopRouter
+from shopping_lists.suggestions import suggest_recipes
+
+
+class CursorPaginatedMixin:
+    """
+    Pages through a queryset by primary key: `?cursor=<last seen id>&limit=<page size>`.
+    Unlike offsets, every page is a single indexed range scan.
+    """
+    fields = ()
+    page_size = 100
+    max_page_size = 500
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def serialize(self, rows):
+        return rows
+
+    def get(self, request, **kwargs):
+        try:
+            cursor = int(request.GET.get('cursor', 0))
+            limit = min(int(request.GET.get('limit', self.page_size)), self.max_page_size)
+            if limit < 1:
+                raise ValueError('limit has to be positive')
+            queryset = self.get_queryset()
+        except ValueError:
+            return JsonResponse({'error': 'Nieprawidłowe parametry zapytania'}, status=400)
+
+        rows = list(queryset.filter(id__gt=cursor).order_by('id').values(*self.fields)[:limit + 1])
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+
+        return JsonResponse({'results': self.serialize(rows),
+                             'next_cursor': rows[-1]['id'] if has_next else None})
+
+
+class FridgeApiView(UserHasAccessToFridgeMixin, CursorPaginatedMixin, View):
+    raise_exception = True
+
+
+class FridgeListApiView(LoginRequiredMixin, CursorPaginatedMixin, View):
+    raise_exception = True
+    fields = ('id', 'name')
+
+    def get_queryset(self):
+        return self.request.user.fridges.all()
+
+
+class ProductListApiView(FridgeApiView):
+    fields = ('id', 'name', 'category_id', 'place', 'quantity', 'unit')
+
+    def get_queryset(self):
+        products = Product.objects.filter(fridge_id=self.kwargs['pk'])
+        place = self.request.GET.get('place')
+        if place is not None:
+            products = products.filter(place=int(place))
+        category = self.request.GET.get('category')
+        if category == 'none':
+            products = products.filter(category=None)
+        elif category is not None:
+            products = products.filter(category_id=int(category))
+        shop = self.request.GET.get('shop')
+        if shop is not None:
+            products = products.filter(shops=int(shop))
+        return products
+
+    def serialize(self, rows):
+        shop_ids = {row['id']: [] for row in rows}
+        for product_id, shop_id in Product.shops.through.objects.filter(
+                product_id__in=shop_ids).values_list('product_id', 'shop_id'):
+            shop_ids[product_id].append(shop_id)
+        for row in rows:
+            row['shop_ids'] = shop_ids[row['id']]
+        return rows
+
+
+class CategoryListApiView(FridgeApiView):
+    fields = ('id', 'name')
+
+    def get_queryset(self):
+        return Category.objects.filter(fridge_id=self.kwargs['pk'])
+
+
+class ShopListApiView(FridgeApiView):
+    fields = ('id', 'name')
+
+    def get_queryset(self):
+        return Shop.objects.filter(fridge_id=self.kwargs['pk'])
+
+
+class RecipeListApiView(FridgeApiView):
+    fields = ('id', 'name', 'owner_id', 'times_used')
+
+    def get_queryset(self):
+        return Recipe.objects.filter(fridge_id=self.kwargs['pk'])
+
+    def serialize(self, rows):
+        products = {row['id']: [] for row in rows}
+        for recipe_id, product_id, quantity in ProductInRecipe.objects.filter(
+                recipe_id__in=products).order_by('id').values_list('recipe_id', 'product_id', 'quantity_in_recipe'):
+            products[recipe_id].append({'product_id': product_id, 'quantity': quantity})
+        for row in rows:
+            row['products'] = products[row['id']]
+        return rows
+
+
+class ProductSearchApiView(UserHasAccessToFridgeMixin, View):
+    """
+    Products matching `?q=` for autocomplete, see Product.search.
+    """
+    raise_exception = True
+    max_results = 50
+
+    def get(self, request, pk):
+        try:
+            limit = min(int(request.GET.get('limit', 10)), self.max_results)
+            if limit < 1:
+                raise ValueError('limit has to be positive')
+        except ValueError:
+            return JsonResponse({'error': 'Nieprawidłowe parametry zapytania'}, status=400)
+
+        return JsonResponse({'results': [{'id': product.id, 'name': product.name, 'unit': product.unit}
+                                         for product in Product.search(pk, request.GET.get('q', ''), limit)]})
+
+
+class RecipeSuggestionsApiView(UserHasAccessToFridgeMixin, View):
+    """
+    Recipes which can be cooked with products in the fridge, see suggest_recipes.
+    """
+    raise_exception = True
+    max_results = 50
+
+    def get(self, request, pk):
+        try:
+            limit = min(int(request.GET.get('limit', 10)), self.max_results)
+        except ValueError:
+            return JsonResponse({'error': 'Nieprawidłowe parametry zapytania'}, status=400)
+
+        return JsonResponse({'results': suggest_recipes(pk, limit)})
+
+
+class ChangeListApiView(UserHasAccessToFridgeMixin, View):
+    """
+    Returns objects changed since version given in `?since=`, together with the current version of the fridge.
+    Clients that send the ETag back in If-None-Match get 304 while nothing has changed.
+    Clients more than CHANGELOG_KEPT_VERSIONS behind get `{"resync": true}` and have to load everything again.
+    """
+    raise_exception = True
+    synced_views = {
+        'product': (Product, ProductListApiView),
+        'category': (Category, CategoryListApiView),
+        'shop': (Shop, ShopListApiView),
+        'recipe': (Recipe, RecipeListApiView),
+    }
+
+    def get(self, request, pk):
+        version = Fridge.objects.filter(pk=pk).values_list('version', flat=True).first()
+        etag = f'"{pk}-{version}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        try:
+            since = int(request.GET.get('since', 0))
+        except ValueError:
+            return JsonResponse({'error': 'Nieprawidłowe parametry zapytania'}, status=400)
+
+        if since < version - settings.CHANGELOG_KEPT_VERSIONS:
+            # changes made before the kept versions are pruned
+            response = JsonResponse({'version': version, 'resync': True})
+            response['ETag'] = etag
+            return response
+
+        changes = {}
+        # an object changed and deleted under the same version is deleted
+        for model, object_id, deleted in ChangeLog.objects.filter(
+                fridge_id=pk, version__gt=since, version__lte=version).order_by('version', 'deleted').values_list(
+                'model', 'object_id', 'deleted'):
+            changes.setdefault(model, {})[object_id] = deleted
+
+        changed, deleted = {}, {}
+        for model_name, (model, view_class) in self.synced_views.items():
+            objects = changes.get(model_name, {})
+            changed_ids = [object_id for object_id, is_deleted in objects.items() if not is_deleted]
+            deleted[model_name] = [object_id for object_id, is_deleted in objects.items() if is_deleted]
+            changed[model_name] = []
+            if changed_ids:
+                rows = list(model.objects.filter(fridge_id=pk, id__in=changed_ids).order_by('id')
+                            .values(*view_class.fields))
+                changed[model_name] = view_class().serialize(rows)
+
+        response = JsonResponse({'version': version, 'changed': changed, 'deleted': deleted})
+        response['ETag'] = etag
+        return response
+
+
+@method_decorator(gzip_page, name='dispatch')
+class ShoppingListBundleApiView(UserHasAccessToFridgeMixin, View):
+    """
+    The shopping list for offline use, see build_shopping_list_bundle. Clients that send the ETag back
+    in If-None-Match get 304 while nothing has changed, later changes can be fetched from ChangeListApiView.
+    """
+    raise_exception = True
+
+    def get(self, request, pk):
+        version = Fridge.objects.filter(pk=pk).values_list('version', flat=True).first()
+        etag = f'"bundle-{pk}-{version}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(build_shopping_list_bundle(pk), json_dumps_params={'separators': (',', ':')})
+        response['ETag'] = etag
+        return response
+
+
+class CommitPurchasesApiView(UserHasAccessToFridgeMixin, View):
+    """
+    Moves products ticked off offline to the fridge in one transaction.
+    Expects JSON `{"product_ids": [delta encoded ids], "bought_at": "<ISO 8601 time, optional>"}`.
+    Products already in the fridge or deleted meanwhile are skipped, so sending the same batch again is harmless.
+    bought_at later than now (by more than clock differences of devices) is rejected.
+    """
+    raise_exception = True
+    # the response carries the version the move was logged under
+    batch_changes = False
+    max_clock_skew = timedelta(minutes=5)
+
+    def post(self, request, pk):
+        try:
+            payload = json.loads(request.body)
+            product_ids = delta_decode(payload['product_ids'])
+            bought_at = parse_datetime(payload['bought_at']) if payload.get('bought_at') else None
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'Nieprawidłowe dane'}, status=400)
+
+        if bought_at is not None:
+            if timezone.is_naive(bought_at):
+                bought_at = timezone.make_aware(bought_at)
+            if bought_at > timezone.now() + self.max_clock_skew:
+                return JsonResponse({'error': 'Data zakupu jest w przyszłości'}, status=400)
+
+        moved = Product.move_to_place(pk, product_ids, 1, bought_at=bought_at) if product_ids else 0
+        version = Fridge.objects.filter(pk=pk).values_list('version', flat=True).first()
+        return JsonResponse({'moved': moved, 'version': version})
+
+
+class FridgeEventsView(UserHasAccessToFridgeMixin, View):
+    """
+    Server-sent events stream of the fridge. `products` events carry products changed since the previous event
+    in the format of ProductListApiView and ids of deleted products, their id is the version of the fridge.
+    A client reconnecting with Last-Event-ID (or `?since=`) older than the current version gets a `resync` event
+    and should fetch missed changes from ChangeListApiView.
+
+    Every open stream holds a worker for as long as the page is open, so it's enabled with EVENTS_STREAM
+    only where that's cheap (e.g. gunicorn with gevent or thread workers), otherwise pages poll ChangeListApiView.
+    """
+    raise_exception = True
+
+    def get(self, request, pk):
+        if not settings.EVENTS_STREAM:
+            return JsonResponse({'error': 'Strumień zdarzeń jest wyłączony'}, status=404)
+        # the page opening the stream passes the version it was rendered with
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('since', '')
+        response = StreamingHttpResponse(self.stream(pk, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # don't let nginx buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    def format_event(event, data, event_id=None):
+        lines = [f'id: {event_id}'] if event_id is not None else []
+        lines += [f'event: {event}', f'data: {json.dumps(data, cls=DjangoJSONEncoder)}']
+        return '\n'.join(lines) + '\n\n'
+
+    def stream(self, pk, last_event_id):
+        # subscribed only once the response is iterated, so a response closed before that leaves no subscription
+        with events.subscribe(pk) as subscription:
+            # subscribe before reading the version, so that no change falls in between
+            version = Fridge.objects.filter(pk=pk).values_list('version', flat=True).first()
+            # nothing is read from the database while waiting for messages, so the connection isn't held
+            # for the lifetime of the stream; inside a transaction it's closed with the transaction
+            connection = connections[Fridge.objects.db]
+            if not connection.in_atomic_block:
+                connection.close()
+            resync = last_event_id.isdigit() and int(last_event_id) < version
+            yield self.format_event('resync' if resync else 'version', {'version': version}, version)
+            while True:
+                message = subscription.get(timeout=settings.EVENTS_KEEPALIVE)
+                if message is None:
+                    # comment lines keep proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                message = json.loads(message)
+                yield self.format_event(message['event'], message['data'], message['data'].get('version'))
+
+
+class FridgeDataApiView(UserHasAccessToFridgeMixin, View):
+    """
+    Read-only data made of independent querysets (get_querysets), which are joined in build().
+    Returns 404 when build() returns None.
+    """
+    raise_exception = True
+
+    def get_querysets(self):
+        raise NotImplementedError
+
+    def build(self, rows):
+        return rows
+
+    def get(self, request, **kwargs):
+        return self.respond({name: list(queryset) for name, queryset in self.get_querysets().items()})
+
+    def respond(self, rows):
+        data = self.build(rows)
+        if data is None:
+            return JsonResponse({'error': 'Nie znaleziono'}, status=404)
+        return JsonResponse(data)
+
+
+def _evaluate(queryset):
+    # close_old_connections only runs in the thread handling the request, so pool threads do the same here:
+    # connections are kept for CONN_MAX_AGE, broken or older ones are closed
+    try:
+        return list(queryset)
+    finally:
+        connections[queryset.db].close_if_unusable_or_obsolete()
+
+
+class AsyncFridgeDataMixin:
+    """
+    Async variant of a FridgeDataApiView: querysets are evaluated concurrently, each in a thread of the pool
+    with its own database connection, so under an ASGI server the response takes as long as the slowest query.
+    Class-based views can't be async in Django 3.1, so as_view returns an async function.
+
+    Querysets don't share a snapshot, when the fridge changes meanwhile rows of one of them can reference
+    objects missing from another, build() leaves such references out.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        async def view(request, *args, **kwargs):
+            self = cls(**initkwargs)
+            self.setup(request, *args, **kwargs)
+            if not await sync_to_async(self.get_test_func(), thread_sensitive=True)():
+                return self.handle_no_permission()
+
+            querysets = self.get_querysets()
+            results = await asyncio.gather(*(sync_to_async(_evaluate, thread_sensitive=False)(queryset)
+                                             for queryset in querysets.values()))
+            return self.respond(dict(zip(querysets, results)))
+
+        view.view_class = cls
+        view.view_initkwargs = initkwargs
+        return view
+
+
+def _shop_ids_by_product(rows, shops):
+    # shops deleted after they were read are left out, see AsyncFridgeDataMixin
+    shop_ids, known_shop_ids = {}, {shop['id'] for shop in shops}
+    for product_id, shop_id in rows:
+        if shop_id in known_shop_ids:
+            shop_ids.setdefault(product_id, []).append(shop_id)
+    return shop_ids
+
+
+class FridgeDetailApiView(FridgeDataApiView):
+    places = {0: 'shopping_list', 1: 'fridge', 2: 'storage'}
+
+    def get_querysets(self):
+        pk = self.kwargs['pk']
+        return {
+            'products': Product.objects.filter(fridge_id=pk).order_by('id').values(
+                'id', 'name', 'category_id', 'place', 'quantity', 'unit', 'next_purchase'),
+            'product_shops': Product.shops.through.objects.filter(product__fridge_id=pk).values_list(
+                'product_id', 'shop_id'),
+            'categories': Category.objects.filter(fridge_id=pk).order_by('id').values('id', 'name'),
+            'shops': Shop.objects.filter(fridge_id=pk).order_by('id').values('id', 'name'),
+            'recipes': Recipe.objects.filter(fridge_id=pk).order_by('id').values('id', 'name', 'owner_id',
+                                                                                 'times_used'),
+        }
+
+    def build(self, rows):
+        shop_ids = _shop_ids_by_product(rows['product_shops'], rows['shops'])
+        products = {name: [] for name in self.places.values()}
+        for product in rows['products']:
+            product['shop_ids'] = shop_ids.get(product['id'], [])
+            products[self.places[product['place']]].append(product)
+        return {'products': products,
+                'categories': rows['categories'],
+                'shops': rows['shops'],
+                'recipes': rows['recipes']}
+
+
+class ShoppingListApiView(FridgeDataApiView):
+    """
+    Products on the shopping list and ids of products to buy in every shop, in the order of shop aisles.
+    """
+
+    def get_querysets(self):
+        pk = self.kwargs['pk']
+        return {
+            'products': Product.objects.filter(fridge_id=pk, place=0).order_by('id').values(
+                'id', 'name', 'category_id', 'quantity', 'unit'),
+            'product_shops': Product.shops.through.objects.filter(
+                product__fridge_id=pk, product__place=0).values_list('product_id', 'shop_id'),
+            'shops': Shop.objects.filter(fridge_id=pk).order_by('id').values('id', 'name'),
+            'categories': Category.objects.filter(fridge_id=pk).order_by('id').values('id'),
+            'aisles': ShopAisle.objects.filter(shop__fridge_id=pk).values_list('shop_id', 'category_id', 'position'),
+        }
+
+    def build(self, rows):
+        router = ShopRouter(rows['shops'], rows['categories'], rows['aisles'], field=dict.get)
+        products_by_shop = router.route(rows['products'], _shop_ids_by_product(rows['product_shops'], rows['shops']))
+        return {'products': rows['products'],
+                'shops': [dict(shop, product_ids=[product['id'] for product in products_by_shop[shop['id']]])
+                          for shop in rows['shops']]}
+
+
+class RecipeDetailApiView(FridgeDataApiView):
+    def get_querysets(self):
+        recipes = Recipe.objects.filter(fridge_id=self.kwargs['fridge_id'], pk=self.kwargs['pk'])
+        return {
+            'recipe': recipes.values('id', 'name', 'owner_id', 'times_used'),
+            'products': ProductInRecipe.objects.filter(recipe__in=recipes).order_by('id').values(
+                'id', 'product_id', 'product__name', 'product__unit', 'quantity_in_recipe'),
+        }
+
+    def build(self, rows):
+        if not rows['recipe']:
+            return None
+        return dict(rows['recipe'][0], products=rows['products'])
+
+
+class FridgeDetailAsyncApiView(AsyncFridgeDataMixin, FridgeDetailApiView):
+    pass
+
+
+class ShoppingListAsyncApiView(AsyncFridgeDataMixin, ShoppingListApiView):
+    pass
+
+
+class RecipeDetailAsyncApiView(AsyncFridgeDataMixin, RecipeDetailApiView):
+    pass
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ShoppingListsConfig(AppConfig):
     name = 'shopping_lists'
+
+    def ready(self):
+        from shopping_lists import instrumentation, signals  # noqa: F401
+        instrumentation.install()
@@ -0,0 +1,91 @@
+from itertools import accumulate
+
+from shopping_lists.models import Fridge, Category, Shop, ShopAisle, Product
+from shopping_lists.routing import ShopRouter
+
+# increased with every incompatible change of the bundle layout
+BUNDLE_FORMAT = 2
+
+
+def delta_encode(ids):
+    """
+    Sorted ids as the first id followed by differences: [120, 121, 125] -> [120, 1, 4].
+    """
+    ids = sorted(ids)
+    return [current - previous for previous, current in zip([0] + ids, ids)]
+
+
+def delta_decode(deltas):
+    if not all(isinstance(delta, int) and delta >= 0 for delta in deltas):
+        raise ValueError('deltas have to be non-negative integers')
+    return list(accumulate(deltas))
+
+
+class StringTable:
+    """
+    Interns strings of the bundle: every string is sent once and referenced by its index.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.indexes = {}
+
+    def __call__(self, string):
+        index = self.indexes.get(string)
+        if index is None:
+            index = self.indexes[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+
+def _compact_number(number):
+    return int(number) if number is not None and number.is_integer() else number
+
+
+def build_shopping_list_bundle(fridge_id):
+    """
+    The shopping list of the fridge for offline use, in columns: every object list has parallel arrays
+    of ids (delta encoded) and attributes, strings are indexes into `strings`, categories of products
+    are indexes into `categories` (-1 for no category). Every shop has indexes into `products` of products
+    to buy there, in the order of its aisles, see ShopRouter.
+    """
+    # read before products, so that a change in between is sent again by the next sync instead of being lost
+    version = Fridge.objects.filter(pk=fridge_id).values_list('version', flat=True).first()
+    categories = list(Category.objects.filter(fridge_id=fridge_id).order_by('id').values('id', 'name'))
+    shops = list(Shop.objects.filter(fridge_id=fridge_id).order_by('id').values('id', 'name'))
+    products = list(Product.objects.filter(fridge_id=fridge_id, place=0).order_by('id')
+                    .values('id', 'name', 'quantity', 'unit', 'category_id'))
+
+    shop_ids_by_product = {}
+    for product_id, shop_id in Product.shops.through.objects.filter(
+            product__fridge_id=fridge_id, product__place=0).values_list('product_id', 'shop_id'):
+        shop_ids_by_product.setdefault(product_id, []).append(shop_id)
+    router = ShopRouter(shops, categories, ShopAisle.objects.filter(shop__fridge_id=fridge_id).values_list(
+        'shop_id', 'category_id', 'position'), field=dict.get)
+    products_by_shop = router.route(products, shop_ids_by_product)
+
+    category_indexes = {category['id']: index for index, category in enumerate(categories)}
+    product_indexes = {product['id']: index for index, product in enumerate(products)}
+    strings = StringTable()
+    return {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'categories': {
+            'ids': delta_encode(category['id'] for category in categories),
+            'names': [strings(category['name']) for category in categories],
+        },
+        'shops': {
+            'ids': delta_encode(shop['id'] for shop in shops),
+            'names': [strings(shop['name']) for shop in shops],
+            'products': [[product_indexes[product['id']] for product in products_by_shop[shop['id']]]
+                         for shop in shops],
+        },
+        'products': {
+            'ids': delta_encode(product['id'] for product in products),
+            'names': [strings(product['name']) for product in products],
+            'quantities': [_compact_number(product['quantity']) for product in products],
+            'units': [strings(product['unit']) for product in products],
+            'categories': [category_indexes.get(product['category_id'], -1) for product in products],
+        },
+        'strings': strings.strings,
+    }
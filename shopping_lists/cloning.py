@@ -0,0 +1,100 @@
+from django.db import transaction
+
+from shopping_lists.models import Fridge, Category, Shop, ShopAisle, Product, Recipe, ProductInRecipe, ProductTrigram, \
+    ChangeLog
+
+PRODUCT_FIELDS = ('name', 'category_id', 'place', 'unit', 'quantity', 'avg_time_between_purchases', 'last_bought',
+                  'next_purchase')
+RECIPE_FIELDS = ('name', 'owner_id', 'times_used')
+
+
+def _copy_by_name(model, fields, source_id, target_id, id_maps):
+    """
+    Copies objects of the source fridge, which have no object with the same name in the target fridge,
+    with one bulk_create. Returns source id -> target id of all source objects and ids of created ones.
+    Foreign keys of copied objects are translated with id_maps of the referenced models.
+    """
+    target_ids = dict(model.objects.filter(fridge_id=target_id).values_list('name', 'id'))
+    rows = list(model.objects.filter(fridge_id=source_id).values('id', *fields))
+    new_rows = [row for row in rows if row['name'] not in target_ids]
+    created_ids = []
+    if new_rows:
+        model.objects.bulk_create([model(fridge_id=target_id,
+                                         **{field: id_maps[field].get(row[field]) if field in id_maps else row[field]
+                                            for field in fields})
+                                   for row in new_rows])
+        target_ids = dict(model.objects.filter(fridge_id=target_id).values_list('name', 'id'))
+        created_ids = [target_ids[row['name']] for row in new_rows]
+    return {row['id']: target_ids[row['name']] for row in rows}, created_ids
+
+
+def copy_fridge_contents(source_id, target_id):
+    """
+    Copies categories, shops with aisles, products with their shops and recipes with their products
+    from the source fridge to the target fridge. Objects with a name already used in the target fridge
+    aren't copied, the ones from the target fridge are used instead with their aisles and recipe products,
+    only shops of products are joined.
+
+    Every model costs a fixed number of queries, whatever the number of objects: ids of copies are looked up
+    by name after bulk_create and kept in id maps (source id -> target id), which translate foreign keys
+    of the next models. Returns id maps by model.
+    """
+    with ChangeLog.batch(), transaction.atomic():
+        categories, created_categories = _copy_by_name(Category, ('name',), source_id, target_id, {})
+        shops, created_shops = _copy_by_name(Shop, ('name',), source_id, target_id, {})
+        products, created_products = _copy_by_name(Product, PRODUCT_FIELDS, source_id, target_id,
+                                                   {'category_id': categories})
+        recipes, created_recipes = _copy_by_name(Recipe, RECIPE_FIELDS, source_id, target_id, {})
+
+        created_shops, created_recipes = set(created_shops), set(created_recipes)
+        ShopAisle.objects.bulk_create([ShopAisle(shop_id=shops[shop_id], category_id=categories[category_id],
+                                                 position=position)
+                                       for shop_id, category_id, position in ShopAisle.objects.filter(
+                                           shop__fridge_id=source_id).values_list('shop_id', 'category_id', 'position')
+                                       if shops[shop_id] in created_shops])
+        product_shops = [Product.shops.through(product_id=products[product_id], shop_id=shops[shop_id])
+                         for product_id, shop_id in Product.shops.through.objects.filter(
+                             product__fridge_id=source_id).values_list('product_id', 'shop_id')]
+        Product.shops.through.objects.bulk_create(product_shops, ignore_conflicts=True)
+        ProductInRecipe.objects.bulk_create([ProductInRecipe(recipe_id=recipes[recipe_id],
+                                                             product_id=products[product_id],
+                                                             quantity_in_recipe=quantity)
+                                             for recipe_id, product_id, quantity in ProductInRecipe.objects.filter(
+                                                 recipe__fridge_id=source_id).values_list(
+                                                 'recipe_id', 'product_id', 'quantity_in_recipe')
+                                             if recipes[recipe_id] in created_recipes])
+
+        if created_recipes:
+            Fridge.recipes_changed([target_id])
+        if created_products:
+            ProductTrigram.index(Product.objects.filter(id__in=created_products).only('id', 'name', 'fridge_id'))
+            Fridge.update_product_counts([target_id])
+        # products from the target fridge can get shops of their namesakes
+        changed_products = set(created_products) | {product_shop.product_id for product_shop in product_shops}
+        for model, created_ids in ((Category, created_categories), (Shop, created_shops),
+                                   (Product, changed_products), (Recipe, created_recipes)):
+            if created_ids:
+                ChangeLog.record(target_id, model, list(created_ids))
+    return {Category: categories, Shop: shops, Product: products, Recipe: recipes}
+
+
+def clone_fridge(fridge, users, name=None):
+    """
+    New fridge of given users with copies of everything in the fridge.
+    """
+    with transaction.atomic():
+        clone = Fridge.objects.create(name=name or f'{fridge.name} (kopia)'[:Fridge._meta.get_field('name').max_length])
+        clone.users.set(users)
+        copy_fridge_contents(fridge.id, clone.id)
+    return clone
+
+
+def merge_fridges(source, target):
+    """
+    Copies everything from the source fridge to the target fridge and shares the target fridge with users of the source.
+    The source fridge is left as it was.
+    """
+    with transaction.atomic():
+        id_maps = copy_fridge_contents(source.id, target.id)
+        target.users.add(*source.users.all())
+    return id_maps
@@ -0,0 +1,102 @@
+import json
+import queue
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.messages = queue.Queue()
+
+    def get(self, timeout=None):
+        """
+        Returns the next message or None if there was none within timeout seconds.
+        """
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalBroker:
+    """
+    Delivers messages to subscribers in this process. Enough for a single server process and tests,
+    with more processes EVENTS_BROKER should point to a broker with the same methods shared between them
+    (e.g. on Redis pub/sub).
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.messages.put(message)
+
+    def has_subscribers(self, channel):
+        return bool(self._subscriptions.get(channel))
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+@receiver(setting_changed)
+def _reset_broker(setting, **kwargs):
+    if setting == 'EVENTS_BROKER':
+        get_broker.cache_clear()
+
+
+def _channel(fridge_id):
+    return f'fridge:{fridge_id}'
+
+
+def publish(fridge_id, event, data):
+    get_broker().publish(_channel(fridge_id), json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder))
+
+
+def has_subscribers(fridge_id):
+    """
+    Lets publishers skip preparing events nobody listens to.
+    """
+    return get_broker().has_subscribers(_channel(fridge_id))
+
+
+def subscribe(fridge_id):
+    """
+    Subscription to events of the fridge, messages are JSON objects with `event` and `data`.
+    """
+    return get_broker().subscribe(_channel(fridge_id))
@@ -0,0 +1,118 @@
+import csv
+import json
+from contextlib import contextmanager
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+
+from shopping_lists.models import Fridge, Category, Shop, Product, Recipe, ProductInRecipe
+
+# rows fetched from the database at once, only this many are held in memory
+CHUNK_SIZE = 2000
+
+RECORD_FIELDS = {
+    'fridge': ('id', 'name', 'version'),
+    'category': ('id', 'name'),
+    'shop': ('id', 'name'),
+    'product': ('id', 'name', 'category_id', 'place', 'unit', 'quantity', 'shop_ids',
+                'avg_time_between_purchases', 'last_bought', 'next_purchase'),
+    'recipe': ('id', 'name', 'times_used'),
+    'product_in_recipe': ('id', 'recipe_id', 'product_id', 'quantity_in_recipe'),
+}
+
+CSV_FIELDS = ('type',) + tuple(dict.fromkeys(field for fields in RECORD_FIELDS.values() for field in fields))
+
+
+def _with_shop_ids(products, links):
+    """
+    Merges product rows with (product id, shop id) rows, both ordered by product id,
+    so shops of products are joined while streaming without loading all of them.
+    """
+    links = iter(links)
+    link = next(links, None)
+    for product in products:
+        shop_ids = []
+        while link is not None and link[0] <= product['id']:
+            if link[0] == product['id']:
+                shop_ids.append(link[1])
+            link = next(links, None)
+        product['shop_ids'] = shop_ids
+        yield product
+
+
+@contextmanager
+def _snapshot(using):
+    """
+    Transaction in which every query sees the same state of the database. SQLite and MySQL (InnoDB) take
+    the snapshot at the first read of a transaction, PostgreSQL only with the repeatable read isolation level,
+    which has to be set before the first query.
+    """
+    connection = connections[using]
+    outermost = not connection.in_atomic_block
+    with transaction.atomic(using):
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def _rows(record_type, queryset):
+    return queryset.order_by('id').values(*RECORD_FIELDS[record_type]).iterator(CHUNK_SIZE)
+
+
+def export_records(fridge_id):
+    """
+    Yields every object of the fridge as a dict with `type` and the fields of RECORD_FIELDS,
+    the fridge first and objects before the ones referencing them.
+    All of them are read in one snapshot, so objects changed during the export can't reference missing ones.
+    """
+    product_fields = tuple(field for field in RECORD_FIELDS['product'] if field != 'shop_ids')
+    products = _with_shop_ids(
+        Product.objects.filter(fridge_id=fridge_id).order_by('id').values(*product_fields).iterator(CHUNK_SIZE),
+        Product.shops.through.objects.filter(product__fridge_id=fridge_id).order_by(
+            'product_id', 'shop_id').values_list('product_id', 'shop_id').iterator(CHUNK_SIZE))
+    records = (
+        ('fridge', _rows('fridge', Fridge.objects.filter(pk=fridge_id))),
+        ('category', _rows('category', Category.objects.filter(fridge_id=fridge_id))),
+        ('shop', _rows('shop', Shop.objects.filter(fridge_id=fridge_id))),
+        ('product', products),
+        ('recipe', _rows('recipe', Recipe.objects.filter(fridge_id=fridge_id))),
+        ('product_in_recipe', _rows('product_in_recipe', ProductInRecipe.objects.filter(recipe__fridge_id=fridge_id))),
+    )
+    with _snapshot(Product.objects.db):
+        for record_type, rows in records:
+            for row in rows:
+                yield {'type': record_type, **row}
+
+
+def export_jsonl(fridge_id):
+    for record in export_records(fridge_id):
+        yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """
+    File-like object returning what is written, so csv.writer produces lines for a generator.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(fridge_id):
+    """
+    One table for all records: columns of fields a record type doesn't have are empty,
+    shop ids of products are separated by `;`.
+    """
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_FIELDS)
+    yield writer.writeheader()
+    for record in export_records(fridge_id):
+        if 'shop_ids' in record:
+            record['shop_ids'] = ';'.join(str(shop_id) for shop_id in record['shop_ids'])
+        yield writer.writerow(record)
+
+
+EXPORTERS = {
+    'csv': (export_csv, 'text/csv'),
+    'jsonl': (export_jsonl, 'application/x-ndjson'),
+}
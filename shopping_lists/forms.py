@@ -1,13 +1,34 @@
 from django import forms
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.forms import formset_factory
 
-from shopping_lists.models import Fridge, Category, Shop, Product, Recipe, ProductInRecipe
+from shopping_lists.models import Fridge, Category, Shop, Product, Recipe, ProductInRecipe, ShopAisle
+from shopping_lists.url_builder import build_url
+
+
+class ProductAutocompleteWidget(forms.Widget):
+    """
+    Text input suggesting products of the fridge from the search api instead of a select with all of them.
+    """
+    template_name = 'shopping_lists/widgets/product_autocomplete.html'
+
+    def __init__(self, fridge_id, attrs=None):
+        super().__init__(attrs)
+        self.fridge_id = fridge_id
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['search_url'] = build_url('api_product_search', pk=self.fridge_id)
+        context['widget']['label'] = Product.objects.filter(pk=value).values_list(
+            'name', flat=True).first() if value and str(value).isdigit() else ''
+        return context
 
 
 class FridgeUniqueModelForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
-        self.fridge = Fridge.objects.get(pk=kwargs.pop('fridge_id'))
+        fridge = kwargs.pop('fridge', None)
+        self.fridge = fridge if fridge is not None else Fridge.objects.get(pk=kwargs.pop('fridge_id'))
         super().__init__(*args, **kwargs)
 
     def clean(self):
@@ -46,6 +67,24 @@ class ShopModelForm(FridgeUniqueModelForm):
             'name': 'Nazwa sklepu:',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # aisles can be set once the shop exists, the form on the fridge page stays short
+        self.categories = list(Category.objects.filter(fridge=self.fridge)) if self.instance.pk else []
+        positions = dict(self.instance.aisles.values_list('category_id', 'position')) if self.categories else {}
+        for category in self.categories:
+            self.fields[f'aisle_{category.id}'] = forms.IntegerField(
+                min_value=1, required=False, initial=positions.get(category.id),
+                label=f'Kolejność kategorii "{category.name}" na drodze przez sklep:')
+
+    def save(self, commit=True):
+        shop = super().save(commit)
+        if commit and self.categories:
+            ShopAisle.set_order(shop, {category.id: self.cleaned_data[f'aisle_{category.id}']
+                                       for category in self.categories
+                                       if self.cleaned_data.get(f'aisle_{category.id}') is not None})
+        return shop
+
 
 class ProductModelForm(FridgeUniqueModelForm):
     class Meta:
@@ -108,7 +147,10 @@ class ProductInRecipeModelForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if self.recipe is None:
             self.recipe = self.instance.recipe
-        self.fields['product'].queryset = Product.objects.filter(fridge=self.recipe.fridge)
+        products = Product.objects.filter(fridge_id=self.recipe.fridge_id)
+        self.fields['product'].queryset = products
+        if products.count() > settings.PRODUCT_AUTOCOMPLETE_THRESHOLD:
+            self.fields['product'].widget = ProductAutocompleteWidget(self.recipe.fridge_id)
         self.fields['quantity_in_recipe'].required = False
         self.fields['quantity_in_recipe'].widget.attrs['min'] = 0
 
@@ -120,3 +162,45 @@ class ProductInRecipeModelForm(forms.ModelForm):
 
     # na przyszłość
     # ProductInRecipeFormSet = formset_factory(ProductInRecipeModelForm)
+
+
+class RecipesToShoppingListForm(forms.Form):
+    recipes = forms.ModelMultipleChoiceField(queryset=Recipe.objects.none(),
+                                             widget=forms.CheckboxSelectMultiple(),
+                                             label='Przepisy, które chcesz dodać do listy zakupów:')
+    servings = forms.FloatField(initial=1, required=False, label='Liczba porcji:')
+
+    def __init__(self, *args, **kwargs):
+        fridge_id = kwargs.pop('fridge_id')
+        super().__init__(*args, **kwargs)
+        self.fields['recipes'].queryset = Recipe.objects.filter(fridge_id=fridge_id)
+
+    def clean_servings(self):
+        servings = self.cleaned_data['servings']
+        if servings is None:
+            return 1
+        if servings <= 0:
+            raise ValidationError('Liczba porcji musi być większa od zera')
+        return servings
+
+
+class ProductImportForm(forms.Form):
+    FORMATS = (
+        ('csv', 'CSV (kolumny: name, quantity, unit, category, shops)'),
+        ('receipt', 'Paragon (produkt w każdej linii)'),
+    )
+
+    file = forms.FileField(label='Plik:')
+    format = forms.ChoiceField(choices=FORMATS, label='Format:')
+    place = forms.TypedChoiceField(choices=Product.PLACES, coerce=int, initial=2, label='Dodaj do:')
+
+
+class FridgeMergeForm(forms.Form):
+    target = forms.ModelChoiceField(queryset=Fridge.objects.none(), label='Przenieś zawartość do lodówki:')
+    delete_source = forms.BooleanField(required=False, label='Usuń tę lodówkę po połączeniu')
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user')
+        source_id = kwargs.pop('source_id')
+        super().__init__(*args, **kwargs)
+        self.fields['target'].queryset = user.fridges.exclude(pk=source_id)
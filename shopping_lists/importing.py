@@ -0,0 +1,163 @@
+import csv
+import re
+from itertools import islice
+
+from django.db import transaction
+
+from shopping_lists.models import Fridge, Category, Shop, Product, ProductTrigram, ChangeLog
+
+# price at the end of a receipt line, e.g. "4,99" or "12.50 zł"
+RECEIPT_PRICE = re.compile(r'\s+\d+[.,]\d{2}\s*(?:zł|pln)?$', re.IGNORECASE)
+RECEIPT_LINE = re.compile(r'^(?P<name>.*?\S)(?:\s+(?P<quantity>\d+(?:[.,]\d+)?)\s*(?P<unit>[^\W\d]+)?)?$')
+
+
+class ImportRow:
+    def __init__(self, line_number, name, quantity=None, unit='', category='', shops=()):
+        self.line_number = line_number
+        self.name = name
+        self.quantity = quantity
+        self.unit = unit
+        self.category = category
+        self.shops = shops
+
+
+def _number(text):
+    return float(text.replace(',', '.')) if text else None
+
+
+def parse_csv(lines):
+    """
+    Rows of CSV with a header: name (required), quantity, unit, category and shops separated by `;`.
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield ImportRow(line_number=reader.line_num,
+                        name=(row.get('name') or '').strip(),
+                        quantity=_number((row.get('quantity') or '').strip()),
+                        unit=(row.get('unit') or '').strip(),
+                        category=(row.get('category') or '').strip(),
+                        shops=tuple(shop.strip() for shop in (row.get('shops') or '').split(';') if shop.strip()))
+
+
+def parse_receipt(lines):
+    """
+    Rows of receipt text, one product per line: name, optionally quantity with unit and price, e.g. "Mleko 2 l 5,98".
+    """
+    for line_number, line in enumerate(lines, start=1):
+        match = RECEIPT_LINE.match(RECEIPT_PRICE.sub('', line.strip()))
+        if match is None:
+            continue
+        yield ImportRow(line_number=line_number,
+                        name=match.group('name'),
+                        quantity=_number(match.group('quantity')),
+                        unit=match.group('unit') or '')
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'receipt': parse_receipt,
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def __str__(self):
+        return f'dodano: {self.created}, pominięto: {self.skipped}, błędy: {len(self.errors)}'
+
+
+def _get_or_create_by_name(model, fridge_id, names):
+    """
+    Ids of objects of the fridge by name, missing ones are created with a single INSERT.
+    """
+    if not names:
+        return {}
+    existing = dict(model.objects.filter(fridge_id=fridge_id, name__in=names).values_list('name', 'id'))
+    missing = names - existing.keys()
+    if missing:
+        model.objects.bulk_create([model(fridge_id=fridge_id, name=name) for name in missing], ignore_conflicts=True)
+        # ids of created rows aren't returned with ignore_conflicts on every database
+        existing.update(model.objects.filter(fridge_id=fridge_id, name__in=missing).values_list('name', 'id'))
+    return existing
+
+
+def _validate(row):
+    name_length = Product._meta.get_field('name').max_length
+    if not row.name:
+        return 'brak nazwy'
+    if len(row.name) > name_length:
+        return f'nazwa dłuższa niż {name_length} znaków'
+    if len(row.unit) > Product._meta.get_field('unit').max_length:
+        return 'za długa jednostka'
+    if len(row.category) > Category._meta.get_field('name').max_length or \
+            any(len(shop) > Shop._meta.get_field('name').max_length for shop in row.shops):
+        return 'za długa nazwa kategorii lub sklepu'
+    if row.quantity is not None and row.quantity < 0:
+        return 'ujemna ilość'
+    return None
+
+
+def _import_batch(fridge_id, rows, place, result):
+    rows_by_name = {}
+    for row in rows:
+        error = _validate(row)
+        if error is not None:
+            result.errors.append((row.line_number, error))
+        elif row.name in rows_by_name:
+            result.skipped += 1
+        else:
+            rows_by_name[row.name] = row
+
+    existing_names = set(Product.objects.filter(fridge_id=fridge_id, name__in=rows_by_name).values_list(
+        'name', flat=True))
+    result.skipped += len(existing_names)
+    new_rows = [row for name, row in rows_by_name.items() if name not in existing_names]
+    if not new_rows:
+        return []
+
+    category_ids = _get_or_create_by_name(Category, fridge_id, {row.category for row in new_rows if row.category})
+    shop_ids = _get_or_create_by_name(Shop, fridge_id, {shop for row in new_rows for shop in row.shops})
+
+    Product.objects.bulk_create([Product(fridge_id=fridge_id,
+                                         name=row.name,
+                                         quantity=row.quantity,
+                                         unit=row.unit,
+                                         category_id=category_ids.get(row.category),
+                                         place=place) for row in new_rows],
+                                ignore_conflicts=True)
+    products = list(Product.objects.filter(fridge_id=fridge_id, name__in=[row.name for row in new_rows]).only(
+        'id', 'name', 'fridge_id'))
+    product_ids = {product.name: product.id for product in products}
+    Product.shops.through.objects.bulk_create([Product.shops.through(product_id=product_ids[row.name],
+                                                                     shop_id=shop_ids[shop])
+                                               for row in new_rows for shop in row.shops],
+                                              ignore_conflicts=True)
+    ProductTrigram.index(products)
+    result.created += len(products)
+    return list(product_ids.values())
+
+
+def import_products(fridge_id, rows, place=2, batch_size=1000):
+    """
+    Creates products of the fridge from ImportRows, reading them in batches, so any number of rows
+    takes memory for one batch only. Every batch costs a fixed number of queries: products already in
+    the fridge are skipped after a single lookup, categories and shops are found or created by name
+    and products are inserted with bulk_create.
+    """
+    result = ImportResult()
+    rows = iter(rows)
+    with transaction.atomic():
+        created_ids = []
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            created_ids += _import_batch(fridge_id, batch, place, result)
+
+        if created_ids:
+            Fridge.update_product_counts([fridge_id])
+            ChangeLog.record(fridge_id, Product, created_ids)
+    return result
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_observers = ContextVar('query_observers', default=())
+# queries of one request can run in several threads at once (see AsyncFridgeDataMixin)
+_observers_lock = threading.Lock()
+
+
+def _observe(execute, sql, params, many, context):
+    observers = _observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = perf_counter() - start
+        with _observers_lock:
+            for observer in observers:
+                observer.add_query(sql, duration)
+
+
+def _install(connection, **kwargs):
+    if _observe not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _observe)
+
+
+def install():
+    """
+    Adds the query observing wrapper to connections of this thread and to every connection opened later,
+    called when the app is ready. Queries run outside of observe_queries only look up the context variable.
+    """
+    connection_created.connect(_install, dispatch_uid='shopping_lists.instrumentation')
+    for connection in connections.all():
+        _install(connection)
+
+
+def current_observers():
+    return _observers.get()
+
+
+@contextmanager
+def observe_queries(observer):
+    """
+    Calls observer.add_query(sql, duration) for every query run in this context, whatever the thread and connection:
+    asgiref copies the context into threads running sync code.
+    """
+    token = _observers.set(_observers.get() + (observer,))
+    try:
+        yield observer
+    finally:
+        _observers.reset(token)
+
+
+class ObservingMiddleware:
+    """
+    Base of middlewares observing queries of whole requests, enabled by the enabled_setting.
+    Subclasses create an observer of a request in start and turn it into the response in finish.
+    Under ASGI the rest of the chain is awaited directly, so requests are not moved to one thread.
+    """
+
+    enabled_setting = None
+    # Django 3.1 breaks the async middleware chain when a sync-only middleware raises MiddlewareNotUsed
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, self.enabled_setting, False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = perf_counter()
+        with observe_queries(self.start(request)) as observer:
+            response = self.get_response(request)
+        return self.finish(request, response, observer, perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = perf_counter()
+        with observe_queries(self.start(request)) as observer:
+            response = await self.get_response(request)
+        return self.finish(request, response, observer, perf_counter() - start)
+
+    def start(self, request):
+        raise NotImplementedError
+
+    def finish(self, request, response, observer, duration):
+        raise NotImplementedError
@@ -0,0 +1,56 @@
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shopping_lists.exporting import EXPORTERS
+from shopping_lists.models import Fridge
+
+
+def export_fridges(fridge_ids, output_dir, export_format):
+    """
+    Writes every fridge to its own gzip compressed file, returns the number of written bytes before compression.
+    """
+    exporter, _ = EXPORTERS[export_format]
+    written = 0
+    for fridge_id in fridge_ids:
+        path = os.path.join(output_dir, f'fridge_{fridge_id}.{export_format}.gz')
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as file:
+            for line in exporter(fridge_id):
+                written += file.write(line)
+    return written
+
+
+class Command(BaseCommand):
+    help = 'Exports every fridge to a compressed file in the output directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir')
+        parser.add_argument('--format', choices=sorted(EXPORTERS), default='jsonl')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes, fridges are split between them')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        output_dir = options['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+        start = perf_counter()
+
+        fridge_ids = list(Fridge.objects.order_by('id').values_list('id', flat=True))
+        # every worker gets every n-th fridge, so big and small fridges are spread between them
+        parts = [fridge_ids[i::workers] for i in range(workers) if fridge_ids[i::workers]]
+
+        if len(parts) <= 1:
+            written = sum(export_fridges(part, output_dir, options['format']) for part in parts)
+        else:
+            # forked workers have to open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=len(parts)) as executor:
+                written = sum(executor.map(export_fridges, parts,
+                                           [output_dir] * len(parts), [options['format']] * len(parts)))
+
+        elapsed = perf_counter() - start
+        self.stdout.write(f'Wyeksportowano lodówek: {len(fridge_ids)} ({written} znaków) w {elapsed:.2f} s')
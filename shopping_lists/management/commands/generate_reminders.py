@@ -0,0 +1,80 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Exists, OuterRef, Min, Max
+from django.utils import timezone
+
+from shopping_lists.models import Fridge, Product, Reminder
+
+
+def due_products_in_chunks(first_fridge_id, last_fridge_id, now, chunk_size):
+    """
+    Yields (product id, next purchase) chunks of products that should be bought by now and have no reminder yet,
+    paginated by primary key, so only one chunk is held in memory.
+    """
+    already_reminded = Reminder.objects.filter(product=OuterRef('pk'), due_at=OuterRef('next_purchase'))
+    products = Product.objects.filter(fridge_id__gte=first_fridge_id, fridge_id__lte=last_fridge_id,
+                                      next_purchase__lte=now).exclude(place=0).filter(~Exists(already_reminded))
+    last_id = 0
+    while True:
+        chunk = list(products.filter(id__gt=last_id).order_by('id').values_list('id', 'next_purchase')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1][0]
+
+
+def generate_reminders(first_fridge_id, last_fridge_id, now, chunk_size):
+    """
+    Returns the number of created reminders: bulk_create with ignore_conflicts doesn't tell which rows were
+    skipped, so they are counted by creation time afterwards.
+    """
+    started = timezone.now()
+    for chunk in due_products_in_chunks(first_fridge_id, last_fridge_id, now, chunk_size):
+        Reminder.objects.bulk_create([Reminder(product_id=product_id, due_at=next_purchase)
+                                      for product_id, next_purchase in chunk],
+                                     ignore_conflicts=True)
+    return Reminder.objects.filter(product__fridge_id__gte=first_fridge_id, product__fridge_id__lte=last_fridge_id,
+                                   created_at__gte=started).count()
+
+
+class Command(BaseCommand):
+    help = 'Creates reminders about products that were probably used up, based on predicted next purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes, each handles its own range of fridge ids')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of products loaded and written at once')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        chunk_size = options['chunk_size']
+        now = timezone.now()
+        start = perf_counter()
+
+        fridge_ids = Fridge.objects.aggregate(first=Min('id'), last=Max('id'))
+        if fridge_ids['first'] is None:
+            self.stdout.write('Brak lodówek')
+            return
+
+        step = (fridge_ids['last'] - fridge_ids['first']) // workers + 1
+        ranges = [(first, min(first + step - 1, fridge_ids['last']))
+                  for first in range(fridge_ids['first'], fridge_ids['last'] + 1, step)]
+
+        if workers == 1:
+            created = sum(generate_reminders(first, last, now, chunk_size) for first, last in ranges)
+        else:
+            # workers are forked, so that they inherit configured Django, and have to open their own connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('fork')) as executor:
+                created = sum(executor.map(generate_reminders, *zip(*ranges),
+                                           [now] * len(ranges), [chunk_size] * len(ranges)))
+
+        elapsed = perf_counter() - start
+        self.stdout.write(f'Utworzono przypomnień: {created} w {elapsed:.2f} s '
+                          f'({created / elapsed if elapsed else 0:.0f} na sekundę)')
@@ -0,0 +1,42 @@
+import sys
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shopping_lists.importing import PARSERS, import_products
+from shopping_lists.models import Fridge, Product
+
+
+class Command(BaseCommand):
+    help = 'Imports products to a fridge from a CSV file or receipt text, streaming it in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fridge_id', type=int)
+        parser.add_argument('path', help='Path to the file, "-" reads standard input')
+        parser.add_argument('--format', choices=sorted(PARSERS), default='csv')
+        parser.add_argument('--place', type=int, choices=[place for place, _ in Product.PLACES], default=2,
+                            help='0 - shopping list, 1 - fridge, 2 - storage')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows read and written at once')
+
+    def handle(self, *args, **options):
+        if not Fridge.objects.filter(pk=options['fridge_id']).exists():
+            raise CommandError(f'Lodówka {options["fridge_id"]} nie istnieje')
+
+        start = perf_counter()
+        if options['path'] == '-':
+            result = self.import_lines(sys.stdin, options)
+        else:
+            with open(options['path'], encoding='utf-8-sig', newline='') as file:
+                result = self.import_lines(file, options)
+
+        for line_number, error in result.errors:
+            self.stderr.write(f'Linia {line_number}: {error}')
+        elapsed = perf_counter() - start
+        rows = result.created + result.skipped + len(result.errors)
+        self.stdout.write(f'Import produktów: {result} w {elapsed:.2f} s '
+                          f'({rows / elapsed if elapsed else 0:.0f} wierszy na sekundę)')
+
+    def import_lines(self, lines, options):
+        return import_products(options['fridge_id'], PARSERS[options['format']](lines),
+                               place=options['place'], batch_size=max(options['batch_size'], 1))
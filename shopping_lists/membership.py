@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from shopping_lists import metrics
+
+from shopping_lists.models import Fridge
+
+
+def _cache_key(user_id, fridge_id):
+    return f'fridge_membership:{user_id}:{fridge_id}'
+
+
+def is_fridge_member(user_id, fridge_id):
+    """
+    Tells whether the user can use the fridge, with a single EXISTS query on a cache miss.
+    Only memberships are cached per (user_id, fridge_id), in the cache shared by all processes:
+    a user who has just joined the fridge must not be turned away by an answer cached by another process,
+    and a removed user must lose access in every process at once.
+    """
+    if user_id is None:
+        return False
+
+    cache = caches['fridge_membership']
+    key = _cache_key(user_id, fridge_id)
+    if cache.get(key):
+        metrics.inc('cache_requests_total', cache='fridge_membership', result='hit')
+        return True
+
+    metrics.inc('cache_requests_total', cache='fridge_membership', result='miss')
+    is_member = Fridge.users.through.objects.filter(user_id=user_id, fridge_id=fridge_id).exists()
+    if is_member:
+        cache.set(key, True, settings.FRIDGE_MEMBERSHIP_TIMEOUT)
+    return is_member
+
+
+def forget_fridge_membership(user_ids, fridge_ids):
+    caches['fridge_membership'].delete_many([_cache_key(user_id, fridge_id)
+                                             for user_id in user_ids for fridge_id in fridge_ids])
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+from pathlib import Path
+from time import monotonic
+
+from django.conf import settings
+from django.http import HttpResponse, Http404
+from django.views import View
+
+from shopping_lists.instrumentation import ObservingMiddleware
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    'view_latency_seconds': ('histogram', 'Time of handling requests by view class'),
+    'view_queries': ('histogram', 'Number of SQL queries per request by view class'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result (hit or miss)'),
+    'products_moved_total': ('counter', 'Products moved between the fridge and the shopping list'),
+    'recipes_added_total': ('counter', 'Recipes added to shopping lists'),
+}
+
+
+class Registry:
+    """
+    Counters and histograms of this process. Every thread writes only to its own dictionary,
+    so recording needs no locks; dictionaries are summed up when metrics are read.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            self._shards.append(shard)
+        return shard
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, value, buckets, **labels):
+        # buckets are cumulative, every one of them is kept even while it's zero
+        for bound in buckets:
+            self.inc(f'{name}_bucket', 1 if value <= bound else 0, le=str(bound), **labels)
+        self.inc(f'{name}_bucket', le='+Inf', **labels)
+        self.inc(f'{name}_sum', value, **labels)
+        self.inc(f'{name}_count', **labels)
+
+    def snapshot(self):
+        values = {}
+        for shard in list(self._shards):
+            for key, value in dict(shard).items():
+                values[key] = values.get(key, 0) + value
+        return values
+
+
+registry = Registry()
+_last_dump = 0
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def _process_file(directory, pid):
+    return Path(directory) / f'metrics-{pid}.json'
+
+
+def dump(directory):
+    """
+    Saves metrics of this process, so that the process answering /metrics can add them up.
+    """
+    path = _process_file(directory, os.getpid())
+    temporary_path = path.with_suffix('.tmp')
+    temporary_path.write_text(json.dumps([[name, labels, value] for (name, labels), value
+                                          in registry.snapshot().items()]))
+    os.replace(temporary_path, path)
+
+
+def collect(directory=None):
+    if directory is None:
+        return registry.snapshot()
+
+    dump(directory)
+    values = {}
+    for path in Path(directory).glob('metrics-*.json'):
+        for name, labels, value in json.loads(path.read_text()):
+            key = (name, tuple(tuple(label) for label in labels))
+            values[key] = values.get(key, 0) + value
+    return values
+
+
+def _format_sample(name, labels, value):
+    label_text = ','.join(f'{label}="{label_value}"' for label, label_value in labels)
+    return f'{name}{{{label_text}}} {value}' if labels else f'{name} {value}'
+
+
+def _histogram_sample_order(sample):
+    name, labels, _ = sample
+    if name.endswith('_bucket'):
+        return 0, float(dict(labels)['le'])
+    return (1, 0) if name.endswith('_sum') else (2, 0)
+
+
+def render(values):
+    """
+    Metrics in the Prometheus text format. Samples of every histogram series (label set) are written together:
+    buckets in the order of their bounds, +Inf last, then the sum and the count.
+    """
+    lines = []
+    for metric, (metric_type, description) in METRICS.items():
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {metric_type}']
+        if metric_type == 'histogram':
+            series = {}
+            for (name, labels), value in values.items():
+                if name in (f'{metric}_bucket', f'{metric}_sum', f'{metric}_count'):
+                    series_labels = tuple(label for label in labels if label[0] != 'le')
+                    series.setdefault(series_labels, []).append((name, labels, value))
+            for series_labels in sorted(series):
+                samples = sorted(series[series_labels], key=_histogram_sample_order)
+                lines += [_format_sample(*sample) for sample in samples]
+        else:
+            lines += [_format_sample(name, labels, value) for (name, labels), value in sorted(values.items())
+                      if name == metric]
+    return '\n'.join(lines) + '\n'
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def add_query(self, sql, duration):
+        self.count += 1
+
+
+class MetricsMiddleware(ObservingMiddleware):
+    """
+    Records latency and SQL query count histograms per view class when METRICS_ENABLED is set.
+    With METRICS_DIR every process (e.g. gunicorn worker) saves its metrics there at most every
+    METRICS_DUMP_INTERVAL seconds.
+    """
+
+    enabled_setting = 'METRICS_ENABLED'
+
+    def start(self, request):
+        return _QueryCounter()
+
+    def finish(self, request, response, queries, duration):
+        global _last_dump
+
+        view = getattr(request, 'metrics_view_name', None)
+        if view is not None:
+            registry.observe('view_latency_seconds', duration, LATENCY_BUCKETS, view=view)
+            registry.observe('view_queries', queries.count, QUERY_COUNT_BUCKETS, view=view)
+
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory is not None and monotonic() - _last_dump > getattr(settings, 'METRICS_DUMP_INTERVAL', 5):
+            _last_dump = monotonic()
+            dump(directory)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        request.metrics_view_name = view_class.__name__ if view_class is not None else view_func.__name__
+
+
+class MetricsView(View):
+    def get(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', False) or \
+                request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+            raise Http404
+        return HttpResponse(render(collect(getattr(settings, 'METRICS_DIR', None))),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
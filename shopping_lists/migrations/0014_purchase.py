@@ -0,0 +1,35 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0013_auto_20201031_2216'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Purchase',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bought_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='next_purchase',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['fridge', 'next_purchase'], name='product_fridge_next_purchase'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchases', to='shopping_lists.product'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0014_purchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='shopping_lists.product')),
+            ],
+            options={
+                'unique_together': {('product', 'due_at')},
+            },
+        ),
+    ]
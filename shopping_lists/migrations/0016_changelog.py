@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0015_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fridge_id', models.IntegerField()),
+                ('version', models.IntegerField()),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fridge',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['fridge_id', 'version'], name='changelog_fridge_version'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0016_changelog'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_fridge_next_purchase',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['fridge', 'place', 'category'], name='product_fridge_place_category'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(next_purchase__isnull=False), fields=['fridge', 'next_purchase'], name='product_fridge_next_purchase'),
+        ),
+    ]
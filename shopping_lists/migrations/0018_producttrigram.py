@@ -0,0 +1,40 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from shopping_lists.search import trigrams
+
+
+def index_products(apps, schema_editor):
+    Product = apps.get_model('shopping_lists', 'Product')
+    ProductTrigram = apps.get_model('shopping_lists', 'ProductTrigram')
+    ProductTrigram.objects.bulk_create([ProductTrigram(product_id=product_id, fridge_id=fridge_id, trigram=trigram)
+                                        for product_id, fridge_id, name in Product.objects.values_list(
+                                            'id', 'fridge_id', 'name').iterator()
+                                        for trigram in trigrams(name)],
+                                       batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0017_product_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fridge_id', models.IntegerField()),
+                ('trigram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='shopping_lists.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='producttrigram',
+            index=models.Index(fields=['fridge_id', 'trigram'], name='trigram_fridge_trigram'),
+        ),
+        migrations.RunPython(index_products, migrations.RunPython.noop),
+    ]
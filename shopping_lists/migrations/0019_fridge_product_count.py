@@ -0,0 +1,28 @@
+# Generated by Django 3.1.2 on 2026-10-18 10:10
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_products(apps, schema_editor):
+    Fridge = apps.get_model('shopping_lists', 'Fridge')
+    Product = apps.get_model('shopping_lists', 'Product')
+    Fridge.objects.update(product_count=Coalesce(models.Subquery(
+        Product.objects.filter(fridge=models.OuterRef('pk')).order_by().values('fridge').annotate(
+            count=models.Count('id')).values('count')[:1]), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0018_producttrigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fridge',
+            name='product_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.1.2 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0019_fridge_product_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopAisle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aisles', to='shopping_lists.category')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aisles', to='shopping_lists.shop')),
+            ],
+            options={
+                'unique_together': {('shop', 'category')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_lists', '0020_shopaisle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fridge',
+            name='recipe_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,11 +1,20 @@
+from contextlib import nullcontext
+
 from django.contrib.auth.mixins import UserPassesTestMixin
-from django.core.exceptions import ObjectDoesNotExist
 from django.http import Http404
 
-from shopping_lists.models import Fridge
+from shopping_lists.membership import is_fridge_member
+from shopping_lists.models import Fridge, ChangeLog
 
 
 class UserHasAccessToFridgeMixin(UserPassesTestMixin):
+    # everything a request changes in the fridge is logged under one version when it ends, see ChangeLog.batch
+    batch_changes = True
+
+    def dispatch(self, request, *args, **kwargs):
+        with ChangeLog.batch() if self.batch_changes else nullcontext():
+            return super().dispatch(request, *args, **kwargs)
+
     def test_func(self):
         fridge_id = None
 
@@ -15,7 +24,8 @@ class UserHasAccessToFridgeMixin(UserPassesTestMixin):
             fridge_id = self.kwargs.get('pk')
 
         if fridge_id is not None:
-            try:
-                return self.request.user in Fridge.objects.get(pk=fridge_id).users.all()
-            except ObjectDoesNotExist:
+            if is_fridge_member(self.request.user.id, fridge_id):
+                return True
+            if not Fridge.objects.filter(pk=fridge_id).exists():
                 raise Http404
+            return False
@@ -1,29 +1,82 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 
 # Create your models here.
-from django.urls import reverse
+from django.utils import timezone
+
+from shopping_lists import metrics
+from shopping_lists.search import normalize, trigrams
+from shopping_lists.url_builder import build_url
+
+# fridges being deleted in this context, see Fridge.delete
+_deleted_fridge_ids = ContextVar('deleted_fridge_ids', default=frozenset())
+# changes recorded inside ChangeLog.batch: fridge id -> (model, deleted) -> object ids
+_batched_changes = ContextVar('batched_changes', default=None)
 
 
 class Fridge(models.Model):
     name = models.CharField(max_length=32)
     users = models.ManyToManyField(User, related_name='fridges')
+    # increased with every change of fridge contents, see ChangeLog
+    version = models.IntegerField(default=0)
+    # kept up to date by signals, products created with bulk_create need update_product_counts
+    product_count = models.IntegerField(default=0)
+    # increased with every change of products of recipes, see suggestions.get_recipe_index
+    recipe_version = models.IntegerField(default=0)
+
+    # fields changed only with UPDATE queries, which save() mustn't overwrite with stale values
+    COUNTER_FIELDS = ('version', 'product_count', 'recipe_version')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        # objects of the fridge are deleted one by one before it, their changes needn't be logged nor counted
+        token = _deleted_fridge_ids.set(_deleted_fridge_ids.get() | {self.pk})
+        try:
+            return super().delete(*args, **kwargs)
+        finally:
+            _deleted_fridge_ids.reset(token)
+
+    @staticmethod
+    def ids_being_deleted():
+        return _deleted_fridge_ids.get()
+
+    @staticmethod
+    def recipes_changed(fridge_ids):
+        Fridge.objects.filter(pk__in=fridge_ids).update(recipe_version=models.F('recipe_version') + 1)
+
+    @staticmethod
+    def update_product_counts(fridge_ids):
+        Fridge.objects.filter(pk__in=fridge_ids).update(product_count=Coalesce(models.Subquery(
+            Product.objects.filter(fridge=models.OuterRef('pk')).order_by().values('fridge').annotate(
+                count=models.Count('id')).values('count')[:1]), 0))
+
     @staticmethod
     def get_create_url():
-        return reverse('fridge_create')
+        return build_url('fridge_create')
 
     def get_detail_url(self):
-        return reverse('fridge_detail', kwargs={'pk': self.id})
+        return build_url('fridge_detail', pk=self.id)
 
     def get_update_url(self):
-        return reverse('fridge_update', kwargs={'pk': self.pk})
+        return build_url('fridge_update', pk=self.pk)
 
     def get_delete_url(self):
-        return reverse('fridge_delete', kwargs={'pk': self.id})
+        return build_url('fridge_delete', pk=self.id)
 
     def get_products_in_shopping_list(self):
         return self.products.filter(place=0)
@@ -46,6 +99,10 @@ class Fridge(models.Model):
     def has_products_in_shopping_list(self):
         return self.get_products_in_shopping_list().count() != 0
 
+    def get_products_due_soon(self, within=None):
+        return self.products.exclude(place=0).filter(
+            next_purchase__lte=timezone.now() + (within or Product.DUE_SOON)).order_by('next_purchase')
+
     def get_delete_name(self):
         return f'lodówkę "{self.name}"'
 
@@ -64,7 +121,7 @@ class Category(models.Model):
         return 'Nie można dodać kolejnej kategorii o takiej nazwie'
 
     def get_create_url(self):
-        return reverse('category_create', kwargs={'pk': self.fridge.pk})
+        return build_url('category_create', pk=self.fridge_id)
 
     def has_products(self):
         return self.fridge.products.filter(category=self).count() != 0
@@ -76,10 +133,10 @@ class Category(models.Model):
         return f'kategorię "{self.name}"'
 
     def get_update_url(self):
-        return reverse('category_update', kwargs={'pk': self.pk, 'fridge_id': self.fridge.id})
+        return build_url('category_update', pk=self.pk, fridge_id=self.fridge_id)
 
     def get_delete_url(self):
-        return reverse('category_delete', kwargs={'pk': self.id, 'fridge_id': self.fridge.id})
+        return build_url('category_delete', pk=self.id, fridge_id=self.fridge_id)
 
 
 class Shop(models.Model):
@@ -96,11 +153,11 @@ class Shop(models.Model):
         return 'Nie można dodać kolejnego sklepu o takiej nazwie'
 
     def get_create_url(self):
-        return reverse('shop_create', kwargs={'pk': self.fridge.pk})
+        return build_url('shop_create', pk=self.fridge_id)
 
     def get_products(self):
-        return Product.objects.filter(fridge=self.fridge, place=0).filter(
-            models.Q(shops=self) | models.Q(shops=None))
+        return Product.objects.filter(fridge_id=self.fridge_id, place=0).filter(
+            models.Q(shops=self) | models.Q(shops=None)).distinct()
 
     def has_products_in_shopping_list(self):
         return self.products.filter(place=0).count() != 0
@@ -109,10 +166,33 @@ class Shop(models.Model):
         return f'sklep "{self.name}"'
 
     def get_update_url(self):
-        return reverse('shop_update', kwargs={'pk': self.pk, 'fridge_id': self.fridge.id})
+        return build_url('shop_update', pk=self.pk, fridge_id=self.fridge_id)
 
     def get_delete_url(self):
-        return reverse('shop_delete', kwargs={'pk': self.id, 'fridge_id': self.fridge.id})
+        return build_url('shop_delete', pk=self.id, fridge_id=self.fridge_id)
+
+
+class ShopAisle(models.Model):
+    """
+    Position of a category on the way through a shop, the shopping list of the shop is sorted by it.
+    """
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='aisles')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='aisles')
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('shop', 'category')
+
+    @staticmethod
+    def set_order(shop, positions):
+        """
+        Replaces aisle positions (category id -> position) of the shop.
+        """
+        with transaction.atomic():
+            ShopAisle.objects.filter(shop=shop).delete()
+            ShopAisle.objects.bulk_create([ShopAisle(shop=shop, category_id=category_id, position=position)
+                                           for category_id, position in positions.items()])
+            ChangeLog.record(shop.fridge_id, Shop, [shop.id])
 
 
 class Product(models.Model):
@@ -125,19 +205,41 @@ class Product(models.Model):
     name = models.CharField(max_length=64)
     fridge = models.ForeignKey(Fridge, on_delete=models.CASCADE, related_name='products')
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, related_name='products', null=True)
+    # in seconds, exponentially weighted so that recent habits matter more
     avg_time_between_purchases = models.IntegerField(null=True, default=None)
     last_bought = models.DateTimeField(null=True, default=None)
+    next_purchase = models.DateTimeField(null=True, default=None)
     place = models.IntegerField(choices=PLACES, default=2)
     unit = models.CharField(max_length=16, default='')
     quantity = models.FloatField(null=True, default=None)
     shops = models.ManyToManyField(Shop, related_name='products')
 
+    # weight of the newest interval in avg_time_between_purchases
+    PURCHASE_INTERVAL_WEIGHT = 0.3
+    # how early products are suggested for the shopping list before their predicted purchase
+    DUE_SOON = timedelta(days=1)
+    # part of trigrams of the query a product has to contain to be found
+    SEARCH_MIN_SIMILARITY = 0.6
+
     class Meta:
         unique_together = ('name', 'fridge')
+        indexes = [
+            # products in the fridge, on the shopping list and their categories
+            models.Index(fields=['fridge', 'place', 'category'], name='product_fridge_place_category'),
+            models.Index(fields=['fridge', 'next_purchase'], name='product_fridge_next_purchase',
+                         condition=models.Q(next_purchase__isnull=False)),
+        ]
 
     def __str__(self):
         return self.name if self.unit == '' else f'{self.name}, jednostka: {self.unit}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # search trigrams are replaced only when the name changes, see signals.product_search_index_changed
+        product._indexed_name = product.__dict__.get('name')
+        return product
+
     def get_quantity(self):
         if self.quantity is None:
             return None
@@ -148,17 +250,94 @@ class Product(models.Model):
         return 'Nie można dodać kolejnego produktu o takiej nazwie'
 
     def get_create_url(self):
-        return reverse('product_create', kwargs={'pk': self.fridge.pk})
+        return build_url('product_create', pk=self.fridge_id)
 
     def get_update_url(self):
-        return reverse('product_update', kwargs={'pk': self.pk, 'fridge_id': self.fridge.id})
+        return build_url('product_update', pk=self.pk, fridge_id=self.fridge_id)
 
     def get_delete_url(self):
-        return reverse('product_delete', kwargs={'pk': self.id, 'fridge_id': self.fridge.id})
+        return build_url('product_delete', pk=self.id, fridge_id=self.fridge_id)
 
     def get_delete_name(self):
         return f'produkt "{self.name}"'
 
+    def register_purchase(self, bought_at):
+        """
+        Updates purchase statistics in place, using only the previous purchase, so history is never rescanned.
+        Purchases not newer than the last one (e.g. synced late from an offline device) don't change them.
+        """
+        if self.last_bought is not None and bought_at <= self.last_bought:
+            return
+        if self.last_bought is not None:
+            interval = int((bought_at - self.last_bought).total_seconds())
+            if self.avg_time_between_purchases is None:
+                self.avg_time_between_purchases = interval
+            else:
+                self.avg_time_between_purchases = round(self.PURCHASE_INTERVAL_WEIGHT * interval +
+                                                        (1 - self.PURCHASE_INTERVAL_WEIGHT) *
+                                                        self.avg_time_between_purchases)
+        self.last_bought = bought_at
+        if self.avg_time_between_purchases is not None:
+            self.next_purchase = bought_at + timedelta(seconds=self.avg_time_between_purchases)
+
+    @staticmethod
+    def search(fridge_id, query, limit=10):
+        """
+        Products of the fridge with names similar to the query, which may be an unfinished name.
+        Names starting with the query come first, then the ones sharing the most trigrams with it.
+
+        Only limit * 4 products sharing the most trigrams are re-ranked. A name starting with the query
+        has all its trigrams, so it is left out only when more than limit * 4 other names have all of them too
+        (e.g. many names with a word starting with a short query).
+        """
+        query_trigrams = trigrams(query, partial=True)
+        if not query_trigrams or limit < 1:
+            return []
+
+        scores = dict(ProductTrigram.objects.filter(fridge_id=fridge_id, trigram__in=query_trigrams)
+                      .values('product_id')
+                      .annotate(score=models.Count('id'))
+                      .filter(score__gte=len(query_trigrams) * Product.SEARCH_MIN_SIMILARITY)
+                      .order_by('-score', 'product_id')
+                      .values_list('product_id', 'score')[:limit * 4])
+
+        normalized_query = normalize(query)
+        products = sorted(Product.objects.filter(id__in=scores),
+                          key=lambda product: (not normalize(product.name).startswith(normalized_query),
+                                               -scores[product.id],
+                                               product.name))
+        return products[:limit]
+
+    @staticmethod
+    def move_to_place(fridge_id, product_ids, place, bought_at=None):
+        """
+        Moves products of given fridge to given place with a single UPDATE and returns the number of moved products.
+        Moving to the fridge counts as buying the product, at bought_at (at most now) or now, purchase statistics
+        of each product are calculated in Python and written with one bulk_update.
+        """
+        with transaction.atomic():
+            products = Product.objects.filter(fridge_id=fridge_id, id__in=product_ids).exclude(place=place)
+            if place != 1:
+                moved_ids = list(products.select_for_update().values_list('id', flat=True))
+                Product.objects.filter(id__in=moved_ids).update(place=place)
+            else:
+                bought_at = min(bought_at or timezone.now(), timezone.now())
+                # every field written by bulk_update has to be loaded, deferred ones would be fetched row by row
+                products = list(products.select_for_update().only('id', 'place', 'last_bought',
+                                                                  'avg_time_between_purchases', 'next_purchase'))
+                for product in products:
+                    product.place = place
+                    product.register_purchase(bought_at)
+                Product.objects.bulk_update(products, ['place', 'last_bought', 'avg_time_between_purchases',
+                                                       'next_purchase'])
+                Purchase.objects.bulk_create([Purchase(product=product, bought_at=bought_at) for product in products])
+                moved_ids = [product.id for product in products]
+
+            if moved_ids:
+                ChangeLog.record(fridge_id, Product, moved_ids)
+                metrics.inc('products_moved_total', len(moved_ids), place=place)
+            return len(moved_ids)
+
 
 class Recipe(models.Model):
     name = models.CharField(max_length=64)
@@ -177,19 +356,19 @@ class Recipe(models.Model):
         return 'Nie można dodać kolejnego przepisu o takiej nazwie'
 
     def get_detail_url(self):
-        return reverse('recipe_detail', kwargs={'pk': self.id, 'fridge_id': self.fridge.id})
+        return build_url('recipe_detail', pk=self.id, fridge_id=self.fridge_id)
 
     def get_create_url(self):
-        return reverse('recipe_create', kwargs={'pk': self.fridge.pk})
+        return build_url('recipe_create', pk=self.fridge_id)
 
     def get_update_url(self):
-        return reverse('recipe_update', kwargs={'pk': self.pk, 'fridge_id': self.fridge.id})
+        return build_url('recipe_update', pk=self.pk, fridge_id=self.fridge_id)
 
     def get_delete_url(self):
-        return reverse('recipe_delete', kwargs={'pk': self.id, 'fridge_id': self.fridge.id})
+        return build_url('recipe_delete', pk=self.id, fridge_id=self.fridge_id)
 
     def get_add_to_shopping_list_url(self):
-        return reverse('add_recipe_to_shopping_list', kwargs={'pk': self.id, 'fridge_id': self.fridge.id})
+        return build_url('add_recipe_to_shopping_list', pk=self.id, fridge_id=self.fridge_id)
 
     def get_delete_name(self):
         return f'przepis "{self.name}"'
@@ -218,10 +397,10 @@ class ProductInRecipe(models.Model):
         return readable_quantity if self.product.unit is None else f'{readable_quantity} {self.product.unit}'
 
     def get_update_url(self):
-        return reverse('product_in_recipe_update', kwargs={'pk': self.pk, 'fridge_id': self.recipe.fridge.id})
+        return build_url('product_in_recipe_update', pk=self.pk, fridge_id=self.recipe.fridge_id)
 
     def get_delete_url(self):
-        return reverse('product_in_recipe_delete', kwargs={'pk': self.id, 'fridge_id': self.recipe.fridge.id})
+        return build_url('product_in_recipe_delete', pk=self.id, fridge_id=self.recipe.fridge_id)
 
     def get_delete_name(self):
         return f'"{self.product.name}" z przepisu "{self.recipe.name}"'
@@ -230,3 +409,119 @@ class ProductInRecipe(models.Model):
 class Invitation(models.Model):
     fridge = models.ForeignKey(Fridge, on_delete=models.CASCADE)
     slug = models.SlugField(unique=True)
+
+
+class Purchase(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='purchases')
+    bought_at = models.DateTimeField()
+
+
+class Reminder(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reminders')
+    due_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('product', 'due_at')
+
+
+# sent by ChangeLog.record with fridge_id, version, object_ids and deleted, the sender is the model of changed objects
+fridge_changed = Signal()
+
+
+class ChangeLog(models.Model):
+    # not a foreign key, so that changes can be logged while the fridge is being deleted
+    fridge_id = models.IntegerField()
+    version = models.IntegerField()
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fridge_id', 'version'], name='changelog_fridge_version'),
+        ]
+
+    @staticmethod
+    def record(fridge_id, model, object_ids, deleted=False):
+        """
+        Increases the version of the fridge and logs changed objects under the new version.
+        Returns the new version or None if the fridge doesn't exist anymore or is being deleted.
+        Inside ChangeLog.batch changes are only collected and None is returned.
+        """
+        if fridge_id in Fridge.ids_being_deleted():
+            return None
+        batched = _batched_changes.get()
+        if batched is not None:
+            batched.setdefault(fridge_id, {}).setdefault((model, deleted), {}).update(dict.fromkeys(object_ids))
+            return None
+        return ChangeLog._log(fridge_id, {(model, deleted): list(object_ids)})
+
+    @staticmethod
+    @contextmanager
+    def batch():
+        """
+        Changes recorded inside are logged when it ends, under one new version of every changed fridge.
+        A nested batch is a part of the outer one. Nothing is logged when an exception is raised,
+        the transaction making the changes is rolled back too.
+        """
+        if _batched_changes.get() is not None:
+            yield
+            return
+        changes = {}
+        token = _batched_changes.set(changes)
+        try:
+            yield
+        finally:
+            _batched_changes.reset(token)
+        for fridge_id, fridge_changes in changes.items():
+            ChangeLog._log(fridge_id, {key: list(object_ids) for key, object_ids in fridge_changes.items()})
+
+    @staticmethod
+    def _log(fridge_id, changes):
+        with transaction.atomic():
+            version = Fridge.objects.select_for_update().filter(pk=fridge_id).values_list('version', flat=True).first()
+            if version is None:
+                return None
+            version += 1
+            Fridge.objects.filter(pk=fridge_id).update(version=version)
+            ChangeLog.objects.bulk_create([ChangeLog(fridge_id=fridge_id,
+                                                     version=version,
+                                                     model=model._meta.model_name,
+                                                     object_id=object_id,
+                                                     deleted=deleted)
+                                           for (model, deleted), object_ids in changes.items()
+                                           for object_id in object_ids])
+            # pruned every tenth of kept versions, so the log of a fridge never holds much more than that
+            kept_versions = settings.CHANGELOG_KEPT_VERSIONS
+            if version % max(kept_versions // 10, 1) == 0:
+                ChangeLog.objects.filter(fridge_id=fridge_id, version__lte=version - kept_versions).delete()
+            for (model, deleted), object_ids in changes.items():
+                fridge_changed.send(sender=model, fridge_id=fridge_id, version=version, object_ids=object_ids,
+                                    deleted=deleted)
+        return version
+
+
+class ProductTrigram(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='trigrams')
+    # copied from the product, so that searching doesn't need a join
+    fridge_id = models.IntegerField()
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fridge_id', 'trigram'], name='trigram_fridge_trigram'),
+        ]
+
+    @staticmethod
+    def index(products):
+        """
+        Replaces search trigrams of given products. Products created with bulk_create have to be indexed this way.
+        """
+        with transaction.atomic():
+            ProductTrigram.objects.filter(product_id__in=[product.id for product in products]).delete()
+            ProductTrigram.objects.bulk_create([ProductTrigram(product_id=product.id,
+                                                               fridge_id=product.fridge_id,
+                                                               trigram=trigram)
+                                                for product in products for trigram in trigrams(product.name)],
+                                               batch_size=1000)
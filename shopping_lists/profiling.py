@@ -0,0 +1,134 @@
+import threading
+from collections import deque
+from functools import wraps
+from time import perf_counter
+
+from django.conf import settings
+from django.template.base import Template
+
+from shopping_lists.instrumentation import ObservingMiddleware, current_observers
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.db_time = 0
+        self.queries = {}
+        self.template_times = {}
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_query_count(self):
+        # the same statement run again with other parameters is usually a query in a loop (N+1)
+        return sum(count - 1 for count in self.queries.values())
+
+    def add_query(self, sql, duration):
+        self.db_time += duration
+        self.queries[sql] = self.queries.get(sql, 0) + 1
+
+    def add_template_time(self, name, duration):
+        self.template_times[name] = self.template_times.get(name, 0) + duration
+
+
+def _instrument_templates():
+    if getattr(Template.render, 'profiled', False):
+        return
+    render = Template.render
+
+    @wraps(render)
+    def profiled_render(self, context):
+        profile = next((observer for observer in current_observers() if isinstance(observer, RequestProfile)), None)
+        if profile is None:
+            return render(self, context)
+        start = perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.add_template_time(self.origin.template_name or self.name, perf_counter() - start)
+
+    profiled_render.profiled = True
+    Template.render = profiled_render
+
+
+def _record(url_name, sample):
+    with _samples_lock:
+        if url_name not in _samples:
+            _samples[url_name] = deque(maxlen=getattr(settings, 'PROFILING_WINDOW', 100))
+        _samples[url_name].append(sample)
+
+
+def get_profiling_summary():
+    """
+    Averages of the last PROFILING_WINDOW requests for every url name, slowest first.
+    """
+    with _samples_lock:
+        samples = {url_name: list(url_samples) for url_name, url_samples in _samples.items()}
+
+    summary = []
+    for url_name, url_samples in samples.items():
+        count = len(url_samples)
+        template_times = {}
+        for sample in url_samples:
+            for name, duration in sample['templates'].items():
+                template_times[name] = template_times.get(name, 0) + duration
+        summary.append({
+            'url_name': url_name,
+            'requests': count,
+            'total_ms': sum(sample['total'] for sample in url_samples) / count * 1000,
+            'db_ms': sum(sample['db'] for sample in url_samples) / count * 1000,
+            'python_ms': sum(sample['total'] - sample['db'] for sample in url_samples) / count * 1000,
+            'queries': sum(sample['queries'] for sample in url_samples) / count,
+            'max_queries': max(sample['queries'] for sample in url_samples),
+            'duplicate_queries': sum(sample['duplicates'] for sample in url_samples) / count,
+            'templates_ms': sorted(((name, duration / count * 1000) for name, duration in template_times.items()),
+                                   key=lambda item: -item[1]),
+        })
+    return sorted(summary, key=lambda item: -item['total_ms'])
+
+
+def reset_profiling_summary():
+    with _samples_lock:
+        _samples.clear()
+
+
+class ProfilingMiddleware(ObservingMiddleware):
+    """
+    Measures SQL queries, database, template and Python time of every request when PROFILING_ENABLED is set.
+    Results are sent in the Server-Timing header and summed up per url name, see get_profiling_summary.
+    When disabled, Django drops the middleware on startup and queries pass the observing wrapper untouched.
+    """
+
+    enabled_setting = 'PROFILING_ENABLED'
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        _instrument_templates()
+
+    def start(self, request):
+        return RequestProfile()
+
+    def finish(self, request, response, profile, total):
+        # included templates are measured inside the templates that include them, so only the top one is summed up
+        template_time = max(profile.template_times.values(), default=0)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={profile.db_time * 1000:.1f};desc="{profile.query_count} queries, '
+            f'{profile.duplicate_query_count} duplicated"',
+            f'tpl;dur={template_time * 1000:.1f}',
+            f'app;dur={(total - profile.db_time) * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+        if request.resolver_match is not None:
+            _record(request.resolver_match.url_name, {
+                'total': total,
+                'db': profile.db_time,
+                'queries': profile.query_count,
+                'duplicates': profile.duplicate_query_count,
+                'templates': profile.template_times,
+            })
+        return response
@@ -0,0 +1,44 @@
+class ShopRouter:
+    """
+    Splits the shopping list between shops in memory and orders every shop's list along its aisles.
+
+    A product without shops can be bought in every shop. Categories with an aisle position in the shop
+    come first, in the order of positions, then the remaining ones in the given order.
+
+    Shops, categories and products can be model instances or rows from values(), field reads their fields
+    (getattr for instances, dict.get for rows).
+    """
+
+    def __init__(self, shops, categories, aisles, field=getattr):
+        self.shops = shops
+        self.categories = categories
+        self.field = field
+        self.positions = {}
+        for shop_id, category_id, position in aisles:
+            self.positions.setdefault(shop_id, {})[category_id] = position
+
+    def get_categories(self, shop_id):
+        positions = self.positions.get(shop_id, {})
+        unordered = len(self.categories)
+        ranks = [(positions.get(self.field(category, 'id'), unordered), i)
+                 for i, category in enumerate(self.categories)]
+        return [self.categories[i] for _, i in sorted(ranks)]
+
+    def route(self, products, shop_ids_by_product):
+        """
+        Returns shop id -> products to buy there, grouped by category in the order of get_categories,
+        products without category at the end.
+        """
+        field = self.field
+        products_by_shop = {field(shop, 'id'): [] for shop in self.shops}
+        for product in products:
+            shop_ids = shop_ids_by_product.get(field(product, 'id'))
+            for shop_id in shop_ids if shop_ids else products_by_shop:
+                if shop_id in products_by_shop:
+                    products_by_shop[shop_id].append(product)
+
+        for shop_id, shop_products in products_by_shop.items():
+            ranks = {field(category, 'id'): rank for rank, category in enumerate(self.get_categories(shop_id))}
+            # sort is stable, so products of a category keep their order
+            shop_products.sort(key=lambda product: ranks.get(field(product, 'category_id'), len(ranks)))
+        return products_by_shop
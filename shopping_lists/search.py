@@ -0,0 +1,26 @@
+import unicodedata
+
+# letters that unicode doesn't decompose into a base letter and a diacritic
+FOLDED_LETTERS = str.maketrans({'ł': 'l', 'ß': 'ss'})
+
+
+def normalize(text):
+    """
+    Lowercase text without diacritics and repeated whitespace: 'Żółty  Ser' -> 'zolty ser'.
+    """
+    text = unicodedata.normalize('NFKD', str(text).lower().translate(FOLDED_LETTERS))
+    return ' '.join(''.join(char for char in text if not unicodedata.combining(char)).split())
+
+
+def trigrams(text, partial=False):
+    """
+    Trigrams of every word of normalized text, padded like in PostgreSQL pg_trgm,
+    so that beginnings of words match short queries.
+    When partial, the last word may be unfinished (autocomplete), so its end is not padded.
+    """
+    words = normalize(text).split()
+    result = set()
+    for i, word in enumerate(words):
+        padded = f'  {word}' if partial and i == len(words) - 1 else f'  {word} '
+        result.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return result
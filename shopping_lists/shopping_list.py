@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Case, When, Value, F, FloatField
+from django.db.models.functions import Coalesce
+
+from shopping_lists import metrics
+from shopping_lists.models import Product, ProductInRecipe, ChangeLog
+
+
+def _quantity_case(quantities, default):
+    return Case(*[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                default=default,
+                output_field=FloatField())
+
+
+def add_recipes_to_shopping_list(fridge_id, servings_by_recipe_id):
+    """
+    Adds products of given recipes (recipe id -> number of servings) to the shopping list of the fridge.
+
+    Quantities are summed up in Python from one read of ProductInRecipe rows and applied by the database,
+    so concurrent changes are not lost: products already on the shopping list get the quantity added,
+    other products are moved to the shopping list with the quantity from recipes.
+    Returns the number of updated products.
+    """
+    metrics.inc('recipes_added_total', len(servings_by_recipe_id))
+    with transaction.atomic():
+        quantities = {}
+        for recipe_id, product_id, quantity in ProductInRecipe.objects.filter(
+                recipe_id__in=servings_by_recipe_id,
+                recipe__fridge_id=fridge_id).values_list('recipe_id', 'product_id', 'quantity_in_recipe'):
+            if quantity is None:
+                quantities.setdefault(product_id, None)
+            else:
+                quantities[product_id] = (quantities.get(product_id) or 0) + quantity * servings_by_recipe_id[recipe_id]
+
+        if not quantities:
+            return 0
+
+        known_quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity is not None}
+        products = Product.objects.filter(fridge_id=fridge_id)
+        # locked, so that only the changed products are logged: products on the shopping list without a known
+        # quantity in recipes stay as they are
+        listed_ids, moved_ids = [], []
+        for product_id, place in products.select_for_update().filter(id__in=quantities).values_list('id', 'place'):
+            if place != 0:
+                moved_ids.append(product_id)
+            elif product_id in known_quantities:
+                listed_ids.append(product_id)
+
+        updated = 0
+        if listed_ids:
+            updated += products.filter(id__in=listed_ids).update(
+                quantity=Coalesce(F('quantity'), Value(0.0)) + _quantity_case(known_quantities, Value(0.0)))
+        if moved_ids:
+            updated += products.filter(id__in=moved_ids).update(
+                place=0, quantity=_quantity_case(known_quantities, F('quantity')))
+
+        if updated:
+            ChangeLog.record(fridge_id, Product, listed_ids + moved_ids)
+
+    return updated
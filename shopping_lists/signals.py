@@ -0,0 +1,134 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, pre_delete, post_save, post_delete
+from django.dispatch import receiver
+
+from shopping_lists import events
+from shopping_lists.api import ProductListApiView
+from shopping_lists.membership import forget_fridge_membership
+from shopping_lists.models import Fridge, Product, Category, Shop, Recipe, ProductInRecipe, ChangeLog, ProductTrigram, \
+    fridge_changed
+
+
+@receiver(m2m_changed, sender=Fridge.users.through)
+def fridge_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if action == 'pre_clear':
+        related = instance.fridges.all() if reverse else instance.users.all()
+        pk_set = set(related.values_list('pk', flat=True))
+
+    if reverse:
+        forget_fridge_membership([instance.pk], pk_set)
+    else:
+        forget_fridge_membership(pk_set, [instance.pk])
+
+
+@receiver(pre_delete, sender=Fridge)
+def fridge_deleted(sender, instance, **kwargs):
+    forget_fridge_membership(instance.users.values_list('pk', flat=True), [instance.pk])
+
+
+@receiver(post_delete, sender=Fridge)
+def fridge_change_log_deleted(sender, instance, **kwargs):
+    ChangeLog.objects.filter(fridge_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Shop)
+@receiver(post_save, sender=Recipe)
+def fridge_object_saved(sender, instance, **kwargs):
+    ChangeLog.record(instance.fridge_id, sender, [instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_created(sender, instance, created, **kwargs):
+    if created:
+        Fridge.objects.filter(pk=instance.fridge_id).update(product_count=F('product_count') + 1)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    if instance.fridge_id in Fridge.ids_being_deleted():
+        return
+    Fridge.objects.filter(pk=instance.fridge_id).update(product_count=F('product_count') - 1)
+
+
+@receiver(post_save, sender=Product)
+def product_search_index_changed(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    if not created and getattr(instance, '_indexed_name', None) == instance.name:
+        return
+    ProductTrigram.index([instance])
+    instance._indexed_name = instance.name
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Shop)
+@receiver(post_delete, sender=Recipe)
+def fridge_object_deleted(sender, instance, **kwargs):
+    ChangeLog.record(instance.fridge_id, sender, [instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=ProductInRecipe)
+@receiver(post_delete, sender=ProductInRecipe)
+def product_in_recipe_changed(sender, instance, **kwargs):
+    # while a fridge is being deleted, only its own recipes lose products
+    if Fridge.ids_being_deleted():
+        return
+    # products of recipe are sent together with the recipe
+    fridge_id = Recipe.objects.filter(pk=instance.recipe_id).values_list('fridge_id', flat=True).first()
+    if fridge_id is not None:
+        Fridge.recipes_changed([fridge_id])
+        ChangeLog.record(fridge_id, Recipe, [instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.products.through)
+def recipe_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # recipe.products.add() and the like insert and delete ProductInRecipe rows without their signals
+    if action not in ('post_add', 'post_remove', 'pre_clear') or Fridge.ids_being_deleted():
+        return
+
+    Fridge.recipes_changed([instance.fridge_id])
+    if not reverse:
+        ChangeLog.record(instance.fridge_id, Recipe, [instance.pk])
+    elif action == 'pre_clear':
+        ChangeLog.record(instance.fridge_id, Recipe, instance.recipe_set.values_list('pk', flat=True))
+    else:
+        ChangeLog.record(instance.fridge_id, Recipe, pk_set)
+
+
+@receiver(m2m_changed, sender=Product.shops.through)
+def product_shops_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        ChangeLog.record(instance.fridge_id, Product, [instance.pk])
+    elif action == 'pre_clear':
+        ChangeLog.record(instance.fridge_id, Product, instance.products.values_list('pk', flat=True))
+    else:
+        ChangeLog.record(instance.fridge_id, Product, pk_set)
+
+
+@receiver(fridge_changed, sender=Product)
+def publish_product_changes(sender, fridge_id, version, object_ids, deleted, **kwargs):
+    object_ids = list(object_ids)
+
+    def publish():
+        if not events.has_subscribers(fridge_id):
+            return
+        changed = []
+        if not deleted:
+            changed = ProductListApiView().serialize(list(Product.objects.filter(
+                fridge_id=fridge_id, id__in=object_ids).order_by('id').values(*ProductListApiView.fields)))
+        events.publish(fridge_id, 'products', {'version': version,
+                                               'changed': changed,
+                                               'deleted': object_ids if deleted else []})
+
+    # listeners would read the products before they are committed
+    transaction.on_commit(publish)
@@ -0,0 +1,105 @@
+from itertools import chain
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from shopping_lists import metrics
+from shopping_lists.models import Product, ShopAisle
+from shopping_lists.routing import ShopRouter
+
+
+class FridgeSnapshot:
+    """
+    Everything `fridge_detail.html` needs, loaded with a fixed number of queries
+    and grouped in memory, so rendering cost does not depend on how many products,
+    categories or shops the fridge has.
+
+    Nothing is loaded until the first attribute is used, so pages rendered
+    from the fragment cache don't query the database.
+    """
+
+    def __init__(self, fridge):
+        self.fridge = fridge
+        self._loaded = False
+
+    def __getattr__(self, name):
+        if name.startswith('_') or self._loaded:
+            raise AttributeError(name)
+        self._loaded = True
+        self._load()
+        return getattr(self, name)
+
+    def get_products_list(self, key):
+        """
+        Products of a list in fridge_detail.html: 'fridge', 'shopping_list', 'due_soon' or a shop id.
+        """
+        if key == 'fridge':
+            return self.products_in_fridge
+        if key == 'shopping_list':
+            return self.products_in_shopping_list
+        if key == 'due_soon':
+            return self.products_due_soon
+        return self.products_by_shop.get(key, [])
+
+    def get_categories(self, key):
+        """
+        Categories in the order they are shown in the list, see get_products_list. Shop lists follow shop aisles.
+        """
+        if key in self.products_by_shop:
+            return self.router.get_categories(key)
+        return self.categories
+
+    def get_shops(self):
+        """
+        Shops for the tabs of the shopping list, which hold forms and can't be cached as fragments.
+        Cached by fridge version like the fragments, so a page rendered from the cache doesn't query for them.
+        """
+        key = f'fridge_shops:{self.fridge.id}:{self.fridge.version}'
+        shops = cache.get(key)
+        if shops is None:
+            metrics.inc('cache_requests_total', cache='fridge_shops', result='miss')
+            shops = self.shops
+            cache.set(key, shops, settings.FRAGMENT_CACHE_TIMEOUT)
+        else:
+            metrics.inc('cache_requests_total', cache='fridge_shops', result='hit')
+        return shops
+
+    def _load(self):
+        fridge = self.fridge
+        self.categories = list(fridge.categories.all())
+        self.shops = list(fridge.shops.all())
+        self.recipes = list(fridge.recipes.all())
+        self.products = list(fridge.products.all())
+
+        shop_ids_by_product = {}
+        for product_id, shop_id in Product.shops.through.objects.filter(
+                product__fridge=fridge).values_list('product_id', 'shop_id'):
+            shop_ids_by_product.setdefault(product_id, set()).add(shop_id)
+
+        # fill the related object caches, so get_*_url and {{ product.category }} don't hit the database
+        for obj in chain(self.categories, self.shops, self.recipes, self.products):
+            obj.fridge = fridge
+        categories_by_id = {category.id: category for category in self.categories}
+
+        self.products_by_place = {place: [] for place, _ in Product.PLACES}
+        self.products_by_category = {}
+        for product in self.products:
+            product.category = categories_by_id.get(product.category_id)
+            self.products_by_place[product.place].append(product)
+            self.products_by_category.setdefault(product.category_id, []).append(product)
+
+        self.products_in_shopping_list = self.products_by_place[0]
+        self.products_in_fridge = self.products_by_place[1]
+
+        due_before = timezone.now() + Product.DUE_SOON
+        self.products_due_soon = sorted((product for product in self.products
+                                         if product.place != 0 and product.next_purchase is not None
+                                         and product.next_purchase <= due_before),
+                                        key=attrgetter('next_purchase'))
+
+        self.router = ShopRouter(self.shops, self.categories, ShopAisle.objects.filter(
+            shop__fridge=fridge).values_list('shop_id', 'category_id', 'position'))
+        self.products_by_shop = self.router.route(self.products_in_shopping_list, shop_ids_by_product)
+        self.shopping_lists = [(shop, self.products_by_shop[shop.id]) for shop in self.shops]
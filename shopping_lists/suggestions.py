@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from shopping_lists import metrics
+from shopping_lists.models import Fridge, Product, Recipe, ProductInRecipe
+from shopping_lists.url_builder import build_url
+
+
+def _cache_key(fridge_id, version):
+    return f'recipe_index:{fridge_id}:{version}'
+
+
+def _add_quantity(quantities, product_id, quantity):
+    # the same product can be in a recipe more than once, unknown quantities don't change known ones
+    if quantity is None:
+        quantities.setdefault(product_id, None)
+    else:
+        quantities[product_id] = (quantities.get(product_id) or 0) + quantity
+
+
+class RecipeIndex:
+    """
+    Products of recipes of a fridge (recipe id -> product id -> quantity) together with the inverted index
+    (product id -> recipe ids), so recipes using given products are found without looking at the other ones.
+    """
+
+    def __init__(self):
+        self.recipes = {}
+        self.products = {}
+
+    @classmethod
+    def build(cls, fridge_id):
+        index = cls()
+        index.update(ProductInRecipe.objects.filter(recipe__fridge_id=fridge_id).values_list(
+            'recipe_id', 'product_id', 'quantity_in_recipe'))
+        return index
+
+    def update(self, rows, recipe_ids=()):
+        """
+        Replaces products of recipes with (recipe id, product id, quantity) rows.
+        Recipes from recipe_ids without rows are removed.
+        """
+        recipes = {recipe_id: {} for recipe_id in recipe_ids}
+        for recipe_id, product_id, quantity in rows:
+            _add_quantity(recipes.setdefault(recipe_id, {}), product_id, quantity)
+
+        for recipe_id, quantities in recipes.items():
+            for product_id in self.recipes.pop(recipe_id, {}):
+                self.products[product_id].discard(recipe_id)
+                if not self.products[product_id]:
+                    del self.products[product_id]
+            if quantities:
+                self.recipes[recipe_id] = quantities
+                for product_id in quantities:
+                    self.products.setdefault(product_id, set()).add(recipe_id)
+
+    def rank(self, available):
+        """
+        Recipes using any of available products (product id -> quantity, None for unknown), best first:
+        by the part of recipe products that are available, then by the number of products with too small quantity.
+        Returns (recipe id, coverage, available product ids, missing product id -> missing quantity) tuples.
+        """
+        matches = {}
+        for product_id in available.keys() & self.products.keys():
+            for recipe_id in self.products[product_id]:
+                matches.setdefault(recipe_id, set()).add(product_id)
+
+        ranked = []
+        for recipe_id, matched in matches.items():
+            needed = self.recipes[recipe_id]
+            missing = {product_id: needed[product_id] for product_id in needed.keys() - matched}
+            for product_id in matched:
+                if needed[product_id] is not None and available[product_id] is not None \
+                        and needed[product_id] > available[product_id]:
+                    missing[product_id] = needed[product_id] - available[product_id]
+            ranked.append((len(matched) / len(needed), len(missing), recipe_id, matched, missing))
+        ranked.sort(key=lambda match: (-match[0], match[1], match[2]))
+        return [(recipe_id, coverage, matched, missing) for coverage, _, recipe_id, matched, missing in ranked]
+
+
+def get_recipe_index(fridge_id):
+    """
+    RecipeIndex of the fridge from the cache. Entries are keyed by the recipe version of the fridge, increased
+    by signals on every change of products of recipes, so all processes build a new index (with a single query)
+    after such a change instead of patching a shared one. Moving or editing products keeps the index.
+    """
+    version = Fridge.objects.filter(pk=fridge_id).values_list('recipe_version', flat=True).first()
+    key = _cache_key(fridge_id, version)
+    index = cache.get(key)
+    if index is None:
+        metrics.inc('cache_requests_total', cache='recipe_index', result='miss')
+        index = RecipeIndex.build(fridge_id)
+        cache.set(key, index, settings.RECIPE_INDEX_TIMEOUT)
+    else:
+        metrics.inc('cache_requests_total', cache='recipe_index', result='hit')
+    return index
+
+
+def suggest_recipes(fridge_id, limit=10):
+    """
+    Recipes which can be cooked with products in the fridge, best first, see RecipeIndex.rank.
+    Costs four queries whatever the number of recipes: version of the fridge, products in the fridge,
+    names of suggested recipes and of their missing products.
+    """
+    available = dict(Product.objects.filter(fridge_id=fridge_id, place=1).values_list('id', 'quantity'))
+    ranked = get_recipe_index(fridge_id).rank(available)[:limit]
+    if not ranked:
+        return []
+
+    names = dict(Recipe.objects.filter(id__in=[recipe_id for recipe_id, *_ in ranked]).values_list('id', 'name'))
+    products = {product_id: (name, unit) for product_id, name, unit in Product.objects.filter(
+        id__in={product_id for *_, missing in ranked for product_id in missing}).values_list('id', 'name', 'unit')}
+    return [{
+        'id': recipe_id,
+        'name': names[recipe_id],
+        'url': build_url('recipe_detail', pk=recipe_id, fridge_id=fridge_id),
+        'coverage': round(coverage, 3),
+        'available': sorted(matched),
+        'missing': [{'id': product_id,
+                     'name': products[product_id][0],
+                     'unit': products[product_id][1],
+                     'quantity': quantity} for product_id, quantity in sorted(missing.items())
+                    # deleted since the index was built
+                    if product_id in products],
+    } for recipe_id, coverage, matched, missing in ranked if recipe_id in names]
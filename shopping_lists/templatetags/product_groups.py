@@ -0,0 +1,29 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter(name='group_by_category')
+def group_by_category(products, categories):
+    """
+    Buckets products by category_id in one pass. Returns (category, products) pairs for non-empty buckets,
+    in the order of given categories, with products without category at the end.
+    """
+    buckets = {}
+    for product in products:
+        buckets.setdefault(product.category_id, []).append(product)
+
+    groups = [(category, buckets[category.id]) for category in categories if category.id in buckets]
+    if None in buckets:
+        groups.append((None, buckets[None]))
+    return groups
+
+
+@register.filter(name='products_list')
+def products_list(snapshot, key):
+    return snapshot.get_products_list(key)
+
+
+@register.filter(name='categories_list')
+def categories_list(snapshot, key):
+    return snapshot.get_categories(key)
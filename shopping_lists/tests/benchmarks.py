@@ -0,0 +1,167 @@
+import asyncio
+import tracemalloc
+from collections import namedtuple
+from time import perf_counter
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from shopping_lists.cloning import clone_fridge
+from shopping_lists.tests.tests import URLS_LOGIN_REQUIRED, URLS_ACCESS_WITH_PK, URLS_ACCESS_WITH_FRIDGE_ID
+from shopping_lists.tests.utils import login
+
+SMALL = {'products': 6, 'categories': 2, 'shops': 2, 'recipes': 2, 'products_per_recipe': 2}
+LARGE = {'products': 120, 'categories': 12, 'shops': 8, 'recipes': 15, 'products_per_recipe': 8}
+
+OBJECT_FOR_URL = {
+    'category_update': lambda fridge: fridge.categories.last(),
+    'category_delete': lambda fridge: fridge.categories.last(),
+    'shop_update': lambda fridge: fridge.shops.last(),
+    'shop_delete': lambda fridge: fridge.shops.last(),
+    'product_update': lambda fridge: fridge.products.last(),
+    'product_delete': lambda fridge: fridge.products.last(),
+    'recipe_detail': lambda fridge: fridge.recipes.last(),
+    'recipe_update': lambda fridge: fridge.recipes.last(),
+    'recipe_delete': lambda fridge: fridge.recipes.last(),
+    'product_in_recipe_create': lambda fridge: fridge.recipes.last(),
+    'product_in_recipe_update': lambda fridge: fridge.recipes.last().productinrecipe_set.last(),
+    'product_in_recipe_delete': lambda fridge: fridge.recipes.last().productinrecipe_set.last(),
+    'add_recipe_to_shopping_list': lambda fridge: fridge.recipes.last(),
+    'invitation_show': lambda fridge: fridge.invitation_set.last(),
+}
+
+
+def get_url(url, fridge):
+    if url in URLS_LOGIN_REQUIRED:
+        return reverse(url)
+    if url in URLS_ACCESS_WITH_PK:
+        return reverse(url, kwargs={'pk': fridge.pk})
+    return reverse(url, kwargs={'pk': OBJECT_FOR_URL[url](fridge).pk, 'fridge_id': fridge.pk})
+
+
+Measurement = namedtuple('Measurement', ('queries', 'wall_time', 'peak_memory'))
+
+
+def measure_request(client, url):
+    tracemalloc.start()
+    start = perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    wall_time = perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert response.status_code < 500
+    return Measurement(len(queries), round(wall_time, 4), peak_memory)
+
+
+def measure(client, url):
+    """
+    Measures the request with empty caches (cold), when fragments, indexes and memberships are built,
+    and the same request again (warm), when they are read from the cache. Returns both Measurements.
+    """
+    cache.clear()
+    cold = measure_request(client, url)
+    return cold, measure_request(client, url)
+
+
+def record_measurements(record_property, prefix, cold, warm):
+    for state, measurement in (('cold', cold), ('warm', warm)):
+        for name, value in measurement._asdict().items():
+            record_property(f'{prefix}_{state}_{name}', value)
+
+
+@pytest.mark.parametrize('url', URLS_LOGIN_REQUIRED + URLS_ACCESS_WITH_PK +
+                         tuple(url for url, _ in URLS_ACCESS_WITH_FRIDGE_ID))
+@pytest.mark.django_db
+def test_query_count_does_not_grow_with_data(client, django_user_model, make_dataset, record_property, url):
+    user = login(client, django_user_model.objects.create(username='benchmark'))
+    results = {}
+    for size, parameters in (('small', SMALL), ('large', LARGE)):
+        fridge = make_dataset(user, **parameters)
+        cold, warm = measure(client, get_url(url, fridge))
+        results[size] = cold.queries, warm.queries
+        record_measurements(record_property, size, cold, warm)
+
+    assert results['large'][0] <= results['small'][0]
+    assert results['large'][1] <= results['small'][1]
+
+
+@pytest.mark.parametrize('url', ('api_fridge_detail', 'api_shopping_list'))
+@pytest.mark.django_db(transaction=True)
+def test_wsgi_and_asgi_throughput(client, django_user_model, make_dataset, record_property, url):
+    requests = 20
+    user = django_user_model.objects.create(username='benchmark')
+    fridge = make_dataset(user, **LARGE)
+    client.force_login(user)
+    async_client = AsyncClient()
+    async_client.force_login(user)
+
+    sync_url = reverse(url, kwargs={'pk': fridge.pk})
+    start = perf_counter()
+    responses = [client.get(sync_url) for _ in range(requests)]
+    wsgi_time = perf_counter() - start
+
+    async def get_all(async_url):
+        return await asyncio.gather(*(async_client.get(async_url) for _ in range(requests)))
+
+    start = perf_counter()
+    async_responses = async_to_sync(get_all)(reverse(f'async_{url}', kwargs={'pk': fridge.pk}))
+    asgi_time = perf_counter() - start
+
+    record_property('wsgi_requests_per_second', round(requests / wsgi_time, 1))
+    record_property('asgi_requests_per_second', round(requests / asgi_time, 1))
+    assert all(response.json() == responses[0].json() for response in responses + list(async_responses))
+
+
+@pytest.mark.django_db
+def test_main_view_stays_flat_with_more_fridges(client, django_user_model, make_dataset, record_property):
+    user = login(client, django_user_model.objects.create(username='benchmark'))
+    results = {}
+    for size, fridges in (('small', 1), ('large', 20)):
+        while user.fridges.count() < fridges:
+            make_dataset(user, **SMALL)
+        cold, warm = measure(client, reverse('main'))
+        results[size] = cold.queries, warm.queries
+        record_measurements(record_property, size, cold, warm)
+
+    assert results['large'] == results['small']
+
+
+@pytest.mark.django_db
+def test_fridge_clone_query_count_does_not_grow_with_data(django_user_model, make_dataset, record_property):
+    user = django_user_model.objects.create_user(username='benchmark', password='benchmark')
+    counts = []
+    for size in (SMALL, LARGE):
+        fridge = make_dataset(user, **size)
+        start = perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            clone_fridge(fridge, [user])
+        record_property(f'clone_{size["products"]}', {'queries': len(queries), 'wall_time': perf_counter() - start})
+        # the backend can split big inserts into batches, every other query is done once
+        counts.append(sum(not query['sql'].startswith('INSERT') for query in queries.captured_queries))
+
+    assert counts[1] == counts[0]
+
+
+@pytest.mark.django_db
+def test_recipe_suggestions_query_count_does_not_grow_with_recipes(client, django_user_model, make_dataset,
+                                                                   record_property):
+    user = django_user_model.objects.create_user(username='benchmark', password='benchmark')
+    client.force_login(user)
+    counts = []
+    for size in (SMALL, LARGE):
+        fridge = make_dataset(user, **size)
+        # every other product in the fridge, so that recipes have both available and missing products
+        product_ids = list(fridge.products.order_by('id').values_list('id', flat=True))
+        fridge.products.update(place=0)
+        fridge.products.filter(id__in=product_ids[::2]).update(place=1)
+        cold, warm = measure(client, reverse('api_recipe_suggestions', kwargs={'pk': fridge.pk}))
+        record_measurements(record_property, f'recipe_suggestions_{size["recipes"]}', cold, warm)
+        counts.append((cold.queries, warm.queries))
+
+    assert counts[1] == counts[0]
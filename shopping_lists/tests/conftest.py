@@ -2,10 +2,18 @@ from random import randint, choice, shuffle, random
 from secrets import token_urlsafe
 
 import pytest
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.test import Client
 
-from shopping_lists.models import Fridge, Category, Shop, Product, Recipe, ProductInRecipe, Invitation
+from shopping_lists.models import Fridge, Category, Shop, Product, Recipe, ProductInRecipe, Invitation, ProductTrigram
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    for alias in settings.CACHES:
+        caches[alias].clear()
 
 
 @pytest.fixture
@@ -63,3 +71,43 @@ def user_without_fridge():
     user.set_password(FakeUser.password)
     user.save()
     return FakeUser
+
+
+@pytest.fixture
+def make_dataset():
+    """
+    Returns a function creating a fridge of given size for the user with bulk inserts,
+    so that big datasets can be used in benchmarks.
+    """
+
+    def make(user, products=10, categories=2, shops=2, recipes=2, products_per_recipe=3):
+        fridge = Fridge.objects.create(name=f'dataset {products}')
+        fridge.users.add(user)
+
+        Category.objects.bulk_create([Category(name=f'category {i}', fridge=fridge) for i in range(categories)])
+        Shop.objects.bulk_create([Shop(name=f'shop {i}', fridge=fridge) for i in range(shops)])
+        Recipe.objects.bulk_create([Recipe(name=f'recipe {i}', fridge=fridge, owner=user) for i in range(recipes)])
+        category_list = list(fridge.categories.all()) + [None]
+        Product.objects.bulk_create([Product(name=f'product {i}',
+                                             fridge=fridge,
+                                             category=category_list[i % len(category_list)],
+                                             place=i % 3,
+                                             quantity=None if i % 4 == 0 else i)
+                                     for i in range(products)])
+
+        shop_list = list(fridge.shops.all())
+        product_list = list(fridge.products.all())
+        ProductTrigram.index(product_list)
+        Fridge.update_product_counts([fridge.pk])
+        Product.shops.through.objects.bulk_create([Product.shops.through(product=product, shop=shop)
+                                                   for i, product in enumerate(product_list)
+                                                   for shop in shop_list[:i % (len(shop_list) + 1)]])
+        ProductInRecipe.objects.bulk_create([ProductInRecipe(recipe=recipe,
+                                                             product=product_list[(i + j) % len(product_list)],
+                                                             quantity_in_recipe=None if j % 2 else j + 1)
+                                             for i, recipe in enumerate(fridge.recipes.all())
+                                             for j in range(min(products_per_recipe, len(product_list)))])
+        Invitation.objects.create(slug=token_urlsafe(32), fridge=fridge)
+        return fridge
+
+    return make
@@ -1,12 +1,45 @@
 # Create your tests here.
+import gzip
+import json
+import re
+from datetime import timedelta
+from io import StringIO
 from random import choice, random
+from unittest.mock import patch
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Q
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse, reverse_lazy
 
-from shopping_lists.models import Fridge, Category, Shop, Product, Recipe, ProductInRecipe, Invitation
+from shopping_lists import events, metrics
+from shopping_lists.api import FridgeDetailApiView, ShoppingListApiView
+from shopping_lists.bundle import delta_encode, delta_decode, StringTable
+from shopping_lists.cloning import merge_fridges
+from shopping_lists.events import LocalBroker
+from shopping_lists.exporting import export_records
+from shopping_lists.forms import ProductInRecipeModelForm, ProductAutocompleteWidget
+from shopping_lists.importing import parse_receipt
+from shopping_lists.models import Fridge, Category, Shop, ShopAisle, Product, Recipe, ProductInRecipe, Invitation, \
+    Reminder, ChangeLog
+from shopping_lists.profiling import get_profiling_summary, reset_profiling_summary
+from shopping_lists.routing import ShopRouter
+from shopping_lists.search import normalize, trigrams
+from shopping_lists.snapshot import FridgeSnapshot
+from shopping_lists.suggestions import RecipeIndex, get_recipe_index
+from shopping_lists.templatetags.product_groups import group_by_category
 from shopping_lists.tests.utils import login
+from shopping_lists.url_builder import build_url
 
 URLS_WITHOUT_AUTH = (
     'index',
@@ -27,12 +60,17 @@ URLS_ACCESS_WITH_PK = (
     'fridge_detail',
     'fridge_update',
     'fridge_delete',
+    'fridge_clone',
+    'fridge_merge',
+    'fridge_export',
     'category_create',
     'shop_create',
     'product_create',
+    'product_import',
     'products_to_fridge',
     'products_to_shopping_list',
     'recipe_create',
+    'add_recipes_to_shopping_list',
     'invitation_create',
 )
 
@@ -410,6 +448,25 @@ def test_recipe_detail(client, set_up):
     assert recipe.id == response.context['object'].id
 
 
+@pytest.mark.django_db
+def test_recipe_detail_query_count_does_not_grow(client, set_up):
+    user = login(client, choice(set_up))
+    recipe = user.recipes.first()
+    url = reverse('recipe_detail', kwargs={'pk': recipe.pk, 'fridge_id': recipe.fridge_id})
+    client.get(url)
+
+    with CaptureQueriesContext(connection) as queries_before:
+        client.get(url)
+    for product in recipe.fridge.products.all():
+        ProductInRecipe.objects.create(recipe=recipe, product=product, quantity_in_recipe=1)
+    with CaptureQueriesContext(connection) as queries_after:
+        response = client.get(url)
+
+    html = response.content.decode()
+    assert html.count(f'/fridges/{recipe.fridge_id}/') > len(response.context['products_in_recipe'])
+    assert len(queries_after) == len(queries_before)
+
+
 @pytest.mark.django_db
 def test_recipe_create(client, set_up):
     user = login(client, choice(set_up))
@@ -632,3 +689,1186 @@ def test_invitation_accept(client, set_up):
 
     assert response.request['PATH_INFO'] == reverse('fridge_detail', kwargs={'pk': invitation.fridge.id})
     assert fridge.invitation_set.all().count() == invitations_before_accept - 1
+
+
+@pytest.mark.django_db
+def test_fridge_detail_query_count_does_not_grow(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    url = reverse('fridge_detail', kwargs={'pk': fridge.pk})
+    client.get(url)
+    cache.clear()
+
+    with CaptureQueriesContext(connection) as queries_before:
+        client.get(url)
+
+    for i in range(5):
+        category = Category.objects.create(name=f'more categories {i}', fridge=fridge)
+        shop = Shop.objects.create(name=f'more shops {i}', fridge=fridge)
+        Recipe.objects.create(name=f'more recipes {i}', fridge=fridge, owner=user)
+        for j in range(5):
+            product = Product.objects.create(name=f'more products {i} {j}', fridge=fridge,
+                                             category=choice((category, None)), place=j % 3)
+            product.shops.set(choice(([], [shop])))
+    cache.clear()
+
+    with CaptureQueriesContext(connection) as queries_after:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(queries_after) == len(queries_before)
+
+
+@pytest.mark.django_db
+def test_fridge_detail_fragments_cached_by_fridge_version(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    url = reverse('fridge_detail', kwargs={'pk': fridge.pk})
+    client.get(url)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert not any('"shopping_lists_product"' in query['sql'] for query in queries.captured_queries)
+    # only choices of the product form, shop tabs of the shopping list come from the cache
+    assert sum(query['sql'].startswith('SELECT "shopping_lists_shop"') for query in queries.captured_queries) == 1
+
+    product = fridge.products.filter(place=1).first()
+    product.name = 'renamed product'
+    product.save()
+
+    response = client.get(url)
+
+    assert 'renamed product' in response.content.decode()
+
+    Shop.objects.create(name='new shop', fridge=fridge)
+    assert 'new shop-tab' in client.get(url).content.decode()
+
+
+@pytest.mark.django_db
+def test_group_by_category(set_up):
+    fridge = Fridge.objects.first()
+    categories = list(fridge.categories.all())
+    products = list(fridge.products.all())
+    products[0].category = None
+
+    groups = group_by_category(products, categories)
+
+    assert [category for category, _ in groups] == [category for category in categories
+                                                    if any(p.category_id == category.id for p in products)] + [None]
+    for category, products_in_category in groups:
+        category_id = None if category is None else category.id
+        assert products_in_category == [p for p in products if p.category_id == category_id]
+
+
+@pytest.mark.django_db
+def test_products_to_fridge_moves_only_products_from_fridge(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    other_fridge = Fridge.objects.exclude(pk=fridge.pk).first()
+    products = list(fridge.products.filter(place=0))
+    other_product = other_fridge.products.create(name='other product', place=0)
+
+    response = client.post(reverse('products_to_fridge', kwargs={'pk': fridge.pk}),
+                           {'product': [product.id for product in products] + [other_product.id]},
+                           follow=True)
+
+    assert Product.objects.get(pk=other_product.pk).place == 0
+    assert f'produktów: {len(products)}' in str(list(response.context['messages'])[0])
+    for product in products:
+        product = Product.objects.get(pk=product.pk)
+        assert product.place == 1
+        assert product.last_bought is not None
+
+
+@pytest.mark.django_db
+def test_add_recipes_to_shopping_list_with_servings(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    recipes = list(fridge.recipes.all())
+    product_on_list, product_in_fridge = fridge.products.all()[:2]
+    Product.objects.filter(pk=product_on_list.pk).update(place=0, quantity=1)
+    Product.objects.filter(pk=product_in_fridge.pk).update(place=1, quantity=10)
+    ProductInRecipe.objects.filter(recipe__in=recipes).delete()
+    for recipe in recipes:
+        ProductInRecipe.objects.create(recipe=recipe, product=product_on_list, quantity_in_recipe=2)
+        ProductInRecipe.objects.create(recipe=recipe, product=product_in_fridge, quantity_in_recipe=3)
+
+    response = client.post(reverse('add_recipes_to_shopping_list', kwargs={'pk': fridge.pk}),
+                           {'recipes': [recipe.id for recipe in recipes], 'servings': 2},
+                           follow=True)
+
+    assert response.request['PATH_INFO'] == reverse('fridge_detail', kwargs={'pk': fridge.pk})
+    assert Product.objects.get(pk=product_on_list.pk).quantity == 1 + 2 * 2 * len(recipes)
+    product_in_fridge = Product.objects.get(pk=product_in_fridge.pk)
+    assert product_in_fridge.place == 0
+    assert product_in_fridge.quantity == 3 * 2 * len(recipes)
+
+
+@pytest.mark.django_db
+def test_add_recipes_to_shopping_list_rejects_zero_servings(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    recipe = fridge.recipes.first()
+    product = fridge.products.first()
+    Product.objects.filter(pk=product.pk).update(place=1, quantity=10)
+    ProductInRecipe.objects.filter(recipe=recipe).delete()
+    ProductInRecipe.objects.create(recipe=recipe, product=product, quantity_in_recipe=2)
+
+    for servings in (0, -1):
+        response = client.post(reverse('add_recipes_to_shopping_list', kwargs={'pk': fridge.pk}),
+                               {'recipes': [recipe.id], 'servings': servings}, follow=True)
+        assert [str(message) for message in response.context['messages']] == \
+            ['Liczba porcji musi być większa od zera']
+    assert Product.objects.get(pk=product.pk).place == 1
+
+
+@pytest.mark.django_db
+def test_add_recipes_to_shopping_list_logs_only_changed_products(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    recipe = fridge.recipes.first()
+    moved, unchanged = fridge.products.all()[:2]
+    Product.objects.filter(pk=moved.pk).update(place=1, quantity=None)
+    Product.objects.filter(pk=unchanged.pk).update(place=0, quantity=None)
+    ProductInRecipe.objects.filter(recipe=recipe).delete()
+    ProductInRecipe.objects.create(recipe=recipe, product=moved, quantity_in_recipe=None)
+    ProductInRecipe.objects.create(recipe=recipe, product=unchanged, quantity_in_recipe=None)
+    version = Fridge.objects.get(pk=fridge.pk).version
+
+    client.post(reverse('add_recipes_to_shopping_list', kwargs={'pk': fridge.pk}), {'recipes': [recipe.id]})
+
+    logged = ChangeLog.objects.filter(fridge_id=fridge.pk, version__gt=version)
+    assert list(logged.values_list('object_id', flat=True)) == [moved.pk]
+
+
+@pytest.mark.django_db
+def test_fridge_membership_is_cached_and_invalidated(client, set_up):
+    user = set_up[1]
+    fridge = set_up[0].fridges.last()
+    login(client, user)
+    url = reverse('fridge_detail', kwargs={'pk': fridge.pk})
+
+    assert client.get(url).status_code == 403
+    # refusals aren't cached, another process could have added the user to the fridge meanwhile
+    Fridge.users.through.objects.create(user=user, fridge=fridge)
+    assert client.get(url).status_code == 200
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).status_code == 200
+    assert not any(query['sql'].startswith('SELECT (1) AS "a" FROM "shopping_lists_fridge_users"')
+                   for query in queries.captured_queries)
+
+    # what another process sees, it has its own instance of the cache
+    other_process_cache = FileBasedCache(settings.CACHES['fridge_membership']['LOCATION'], {})
+    assert other_process_cache.get(f'fridge_membership:{user.pk}:{fridge.pk}')
+    fridge.users.remove(user)
+    assert other_process_cache.get(f'fridge_membership:{user.pk}:{fridge.pk}') is None
+    assert client.get(url).status_code == 403
+
+
+@pytest.mark.django_db
+def test_purchase_interval_prediction(set_up):
+    fridge = Fridge.objects.first()
+    product = fridge.products.first()
+    bought_at = timezone.now() - timedelta(days=30)
+
+    for days in (0, 10, 20, 24):
+        Product.objects.filter(pk=product.pk).update(place=0)
+        with patch('shopping_lists.models.timezone.now', return_value=bought_at + timedelta(days=days)):
+            assert Product.move_to_place(fridge.id, [product.id], 1) == 1
+
+    product = Product.objects.get(pk=product.pk)
+    expected_interval = 0.3 * 4 + 0.7 * (0.3 * 10 + 0.7 * 10)
+    assert product.avg_time_between_purchases == round(expected_interval * 24 * 60 * 60)
+    assert product.next_purchase == product.last_bought + timedelta(seconds=product.avg_time_between_purchases)
+    assert product.purchases.count() == 4
+    assert list(fridge.get_products_due_soon()) == []
+    assert list(fridge.get_products_due_soon(within=timedelta(days=3))) == [product]
+
+
+@pytest.mark.django_db
+def test_move_to_fridge_query_count_does_not_depend_on_number_of_products(set_up):
+    fridge = Fridge.objects.first()
+    last_bought = timezone.now() - timedelta(days=7)
+    counts = []
+    for size in (5, 40):
+        # products bought for the first time get no next_purchase, it mustn't be loaded for them one by one
+        Product.objects.bulk_create([Product(name=f'bought {size} {i}', fridge=fridge, place=0,
+                                             last_bought=last_bought if i % 2 else None,
+                                             avg_time_between_purchases=24 * 60 * 60 if i % 2 else None)
+                                     for i in range(size)])
+        product_ids = list(fridge.products.filter(name__startswith=f'bought {size} ').values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            assert Product.move_to_place(fridge.id, product_ids, 1) == size
+        counts.append(len(queries))
+
+    assert counts[0] == counts[1]
+    assert all(product.next_purchase > product.last_bought for product in fridge.products.filter(
+        name__startswith='bought ', avg_time_between_purchases__isnull=False))
+
+
+@pytest.mark.django_db
+def test_generate_reminders(set_up):
+    products = list(Product.objects.all()[:3])
+    Product.objects.filter(pk__in=[product.pk for product in products[:2]]).update(
+        place=1, next_purchase=timezone.now() - timedelta(days=1))
+    Product.objects.filter(pk=products[2].pk).update(place=1, next_purchase=timezone.now() + timedelta(days=1))
+
+    outputs = [StringIO(), StringIO()]
+    for output in outputs:
+        call_command('generate_reminders', workers=1, chunk_size=1, stdout=output)
+
+    assert [output.getvalue().split(' w ')[0] for output in outputs] == \
+        ['Utworzono przypomnień: 2', 'Utworzono przypomnień: 0']
+    assert set(Reminder.objects.values_list('product_id', flat=True)) == {product.pk for product in products[:2]}
+
+
+API_URLS_WITH_PK = (
+    'api_product_list',
+    'api_category_list',
+    'api_shop_list',
+    'api_recipe_list',
+    'api_product_search',
+    'api_change_list',
+    'api_fridge_detail',
+    'api_shopping_list',
+    'async_api_fridge_detail',
+    'async_api_shopping_list',
+    'api_fridge_events',
+    'api_shopping_list_bundle',
+    'api_commit_purchases',
+    'api_recipe_suggestions',
+)
+
+
+@pytest.mark.parametrize('url', API_URLS_WITH_PK)
+@pytest.mark.django_db
+def test_api_restrict_access(client, set_up, user_without_fridge, url):
+    fridge = Fridge.objects.first()
+    assert client.get(reverse(url, kwargs={'pk': fridge.pk})).status_code == 403
+    client.login(username=user_without_fridge.username, password=user_without_fridge.password)
+    assert client.get(reverse(url, kwargs={'pk': fridge.pk})).status_code == 403
+
+
+@pytest.mark.django_db
+def test_api_product_list_cursor_pagination(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    url = reverse('api_product_list', kwargs={'pk': fridge.pk})
+
+    ids = []
+    data = {'next_cursor': 0}
+    while data['next_cursor'] is not None:
+        data = client.get(url, {'cursor': data['next_cursor'], 'limit': 4}).json()
+        ids += [product['id'] for product in data['results']]
+
+    assert ids == list(fridge.products.order_by('id').values_list('id', flat=True))
+    for limit in (0, -1):
+        assert client.get(url, {'limit': limit}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_api_product_list_filters(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    shop = fridge.shops.first()
+    url = reverse('api_product_list', kwargs={'pk': fridge.pk})
+
+    products = client.get(url, {'place': 0, 'shop': shop.id}).json()['results']
+
+    assert {product['id'] for product in products} == set(
+        fridge.products.filter(place=0, shops=shop).values_list('id', flat=True))
+    for product in products:
+        assert shop.id in product['shop_ids']
+    assert client.get(url, {'place': 'fridge'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_api_change_list(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    url = reverse('api_change_list', kwargs={'pk': fridge.pk})
+    response = client.get(url)
+    version = response.json()['version']
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+
+    client.post(reverse('product_create', kwargs={'pk': fridge.pk}), {'name': 'new product'})
+    product = Product.objects.get(fridge=fridge, name='new product')
+    deleted_category_id = fridge.categories.first().id
+    Category.objects.get(pk=deleted_category_id).delete()
+    products_to_fridge = list(fridge.products.filter(place=0).values_list('id', flat=True))
+    client.post(reverse('products_to_fridge', kwargs={'pk': fridge.pk}), {'product': products_to_fridge})
+
+    response = client.get(url, {'since': version}, HTTP_IF_NONE_MATCH=response['ETag'])
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data['version'] > version
+    assert {row['id'] for row in data['changed']['product']} == {product.id, *products_to_fridge}
+    assert data['deleted']['category'] == [deleted_category_id]
+    assert client.get(url, {'since': data['version']}).json()['changed']['product'] == []
+
+
+@pytest.mark.django_db
+def test_request_changes_are_logged_under_one_version(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    version = fridge.version
+
+    client.post(reverse('product_create', kwargs={'pk': fridge.pk}),
+                {'name': 'new product', 'shops': list(fridge.shops.values_list('id', flat=True))})
+    product = Product.objects.get(fridge=fridge, name='new product')
+
+    assert Fridge.objects.get(pk=fridge.pk).version == version + 1
+    assert list(ChangeLog.objects.filter(fridge_id=fridge.pk, version=version + 1).values_list(
+        'model', 'object_id')) == [('product', product.id)]
+
+
+@pytest.mark.django_db
+def test_fridge_delete_does_not_log_its_objects(django_user_model, make_dataset):
+    user = django_user_model.objects.create_user(username='owner', password='owner')
+    query_counts = []
+    for products in (10, 50):
+        fridge = make_dataset(user, products=products, recipes=products // 5)
+        ChangeLog.record(fridge.pk, Product, fridge.products.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            fridge.delete()
+        query_counts.append(len(queries))
+
+        assert not ChangeLog.objects.filter(fridge_id=fridge.pk).exists()
+
+    assert query_counts[1] == query_counts[0]
+
+
+@pytest.mark.django_db
+def test_api_change_list_resync_beyond_kept_versions(client, set_up, settings):
+    settings.CHANGELOG_KEPT_VERSIONS = 10
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    product = fridge.products.first()
+    url = reverse('api_change_list', kwargs={'pk': fridge.pk})
+    for _ in range(30):
+        version = ChangeLog.record(fridge.pk, Product, [product.id])
+
+    assert ChangeLog.objects.filter(fridge_id=fridge.pk).count() <= 11
+    assert client.get(url, {'since': version - 11}).json() == {'version': version, 'resync': True}
+    data = client.get(url, {'since': version - 10}).json()
+    assert [row['id'] for row in data['changed']['product']] == [product.id]
+
+
+@pytest.mark.parametrize('index, queryset', (
+    ('product_fridge_place_category', lambda fridge: fridge.get_products_in_fridge()),
+    ('product_fridge_place_category',
+     lambda fridge: fridge.products.filter(place=0, category=fridge.categories.first())),
+    ('product_fridge_next_purchase', lambda fridge: fridge.get_products_due_soon()),
+))
+@pytest.mark.django_db
+def test_product_indexes_are_used(set_up, index, queryset):
+    fridge = Fridge.objects.first()
+    categories = list(fridge.categories.all()) + [None]
+    Product.objects.bulk_create([Product(name=f'seeded product {i}', fridge=fridge, place=i % 3,
+                                         category=categories[i % len(categories)],
+                                         next_purchase=timezone.now() if i % 10 == 0 else None)
+                                 for i in range(2000)])
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off' if connection.vendor == 'postgresql' else 'ANALYZE')
+
+    assert index in queryset(fridge).explain()
+
+
+@pytest.mark.django_db
+def test_profiling_middleware(client, set_up, settings):
+    settings.PROFILING_ENABLED = True
+    reset_profiling_summary()
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+
+    response = client.get(reverse('fridge_detail', kwargs={'pk': fridge.pk}))
+
+    assert 'db;dur=' in response['Server-Timing']
+    summary = {row['url_name']: row for row in get_profiling_summary()}
+    assert summary['fridge_detail']['queries'] > 0
+    assert 'shopping_lists/product/product_row.html' in dict(summary['fridge_detail']['templates_ms'])
+
+    user.is_staff = True
+    user.save()
+    assert client.get(reverse('profiling_panel')).status_code == 200
+
+
+@pytest.mark.django_db
+def test_profiling_middleware_disabled(client, set_up):
+    user = login(client, choice(set_up))
+    response = client.get(reverse('fridge_detail', kwargs={'pk': user.fridges.first().pk}))
+    assert 'Server-Timing' not in response
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, set_up, settings):
+    settings.METRICS_ENABLED = True
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    client.get(reverse('fridge_detail', kwargs={'pk': fridge.pk}))
+    client.post(reverse('products_to_fridge', kwargs={'pk': fridge.pk}),
+                {'product': list(fridge.products.filter(place=0).values_list('id', flat=True))})
+
+    text = client.get(reverse('metrics')).content.decode()
+
+    assert '# TYPE view_latency_seconds histogram' in text
+    assert 'view_latency_seconds_count{view="FridgeDetailView"}' in text
+    assert 'view_queries_bucket{le="+Inf",view="ProductsToFridge"}' in text
+    assert 'cache_requests_total{cache="fridge_membership",result="hit"}' in text
+    assert 'products_moved_total{place="1"}' in text
+
+
+def test_metrics_histograms_in_prometheus_text_format():
+    registry = metrics.Registry()
+    for view, value in (('B', 3), ('A', 0.5), ('B', 30), ('A', 200)):
+        registry.observe('view_queries', value, metrics.QUERY_COUNT_BUCKETS, view=view)
+
+    samples = [line for line in metrics.render(registry.snapshot()).splitlines()
+               if line.startswith('view_queries')]
+
+    expected = []
+    for view, values in (('A', (0.5, 200)), ('B', (3, 30))):
+        expected += [f'view_queries_bucket{{le="{bound}",view="{view}"}} {sum(value <= bound for value in values)}'
+                     for bound in metrics.QUERY_COUNT_BUCKETS]
+        expected += [f'view_queries_bucket{{le="+Inf",view="{view}"}} 2',
+                     f'view_queries_sum{{view="{view}"}} {sum(values)}',
+                     f'view_queries_count{{view="{view}"}} 2']
+    assert samples == expected
+
+
+def test_metrics_are_summed_up_across_processes(tmp_path):
+    metrics.dump(tmp_path)
+    (tmp_path / 'metrics-0.json').write_text(json.dumps([['recipes_added_total', [], 2]]))
+    metrics.inc('recipes_added_total', 3)
+
+    assert metrics.collect(tmp_path)[('recipes_added_total', ())] == \
+        metrics.registry.snapshot()[('recipes_added_total', ())] + 2
+
+
+@pytest.mark.django_db
+def test_build_url_matches_reverse(set_up):
+    fridge = Fridge.objects.first()
+    recipe = fridge.recipes.first()
+    objects = [fridge, fridge.categories.first(), fridge.shops.first(), fridge.products.first(), recipe]
+    url_getters = ('get_create_url', 'get_detail_url', 'get_update_url', 'get_delete_url',
+                   'get_add_to_shopping_list_url')
+
+    for obj in objects:
+        for url_getter in url_getters:
+            if hasattr(obj, url_getter):
+                assert getattr(obj, url_getter)().startswith('/fridges/')
+
+    assert build_url('category_update', pk=3, fridge_id=2) == reverse('category_update',
+                                                                      kwargs={'pk': 3, 'fridge_id': 2})
+    assert build_url('invitation_accept', slug='abc') == reverse('invitation_accept', kwargs={'slug': 'abc'})
+    assert build_url('main') == reverse('main')
+
+
+@pytest.mark.django_db
+def test_model_urls_dont_query_related_objects(set_up):
+    products_in_recipe = list(ProductInRecipe.objects.select_related('recipe'))
+    products = list(Product.objects.all())
+
+    with CaptureQueriesContext(connection) as queries:
+        for product_in_recipe in products_in_recipe:
+            assert product_in_recipe.get_update_url() == reverse(
+                'product_in_recipe_update', kwargs={'pk': product_in_recipe.pk,
+                                                    'fridge_id': product_in_recipe.recipe.fridge_id})
+        for product in products:
+            assert product.get_delete_url() == reverse('product_delete',
+                                                       kwargs={'pk': product.pk, 'fridge_id': product.fridge_id})
+
+    assert len(queries) == 0
+
+
+def test_search_normalize_and_trigrams():
+    assert normalize(' Żółty  SER łosoś ') == 'zolty ser losos'
+    assert trigrams('ser') == {'  s', ' se', 'ser', 'er '}
+    assert trigrams('ser', partial=True) == {'  s', ' se', 'ser'}
+
+
+@pytest.mark.django_db
+def test_product_search(set_up):
+    fridge = Fridge.objects.first()
+    for name in ('Mleko', 'Mleko kokosowe', 'Masło', 'Żółty ser', 'Jogurt mleczny'):
+        Product.objects.create(name=name, fridge=fridge)
+
+    assert [product.name for product in Product.search(fridge.id, 'mle')][:2] == ['Mleko', 'Mleko kokosowe']
+    assert 'Jogurt mleczny' in [product.name for product in Product.search(fridge.id, 'mle')]
+    assert [product.name for product in Product.search(fridge.id, 'zolty')] == ['Żółty ser']
+    assert [product.name for product in Product.search(fridge.id, 'masl')] == ['Masło']
+    assert Product.search(Fridge.objects.exclude(pk=fridge.pk).first().id, 'Żółty ser') == []
+
+    product = fridge.products.get(name='Masło')
+    product.quantity = 2
+    with CaptureQueriesContext(connection) as queries:
+        product.save()
+    assert not any('shopping_lists_producttrigram' in query['sql'] for query in queries.captured_queries)
+
+    product.name = 'Margaryna'
+    product.save()
+    assert Product.search(fridge.id, 'masl') == []
+    assert [product.name for product in Product.search(fridge.id, 'marg')] == ['Margaryna']
+
+
+@pytest.mark.django_db
+def test_api_product_search(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    product = Product.objects.create(name='Ćwikła z chrzanem', fridge=fridge, unit='słoik')
+
+    response = client.get(reverse('api_product_search', kwargs={'pk': fridge.pk}), {'q': 'cwik'})
+
+    assert response.status_code == 200
+    assert response.json()['results'][0] == {'id': product.id, 'name': product.name, 'unit': 'słoik'}
+    for limit in (0, -1):
+        assert client.get(reverse('api_product_search', kwargs={'pk': fridge.pk}),
+                          {'q': 'cwik', 'limit': limit}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_product_search_candidates_with_all_query_trigrams(set_up):
+    fridge = Fridge.objects.first()
+    for i in range(5):
+        Product.objects.create(name=f'Żółty ser {i}', fridge=fridge)
+    Product.objects.create(name='Serek', fridge=fridge)
+
+    # a name starting with the query shares all its trigrams, like the five older names
+    assert [product.name for product in Product.search(fridge.id, 'ser', limit=2)][0] == 'Serek'
+    # only limit * 4 of them are re-ranked
+    assert [product.name for product in Product.search(fridge.id, 'ser', limit=1)] == ['Żółty ser 0']
+    assert Product.search(fridge.id, 'ser', limit=0) == []
+
+
+@pytest.mark.django_db
+def test_product_in_recipe_form_uses_autocomplete_for_many_products(set_up, settings):
+    recipe = Recipe.objects.first()
+    settings.PRODUCT_AUTOCOMPLETE_THRESHOLD = recipe.fridge.products.count()
+
+    assert not isinstance(ProductInRecipeModelForm(recipe=recipe).fields['product'].widget,
+                          ProductAutocompleteWidget)
+
+    Product.objects.create(name='one more product', fridge=recipe.fridge)
+    form = ProductInRecipeModelForm(recipe=recipe)
+
+    assert isinstance(form.fields['product'].widget, ProductAutocompleteWidget)
+    html = str(form['product'])
+    assert reverse('api_product_search', kwargs={'pk': recipe.fridge_id}) in html
+    assert '<option' not in html
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_api_returns_the_same_data(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    recipe = fridge.recipes.first()
+    fridge.products.filter(place=0).first().shops.clear()
+
+    for url, kwargs in (('api_fridge_detail', {'pk': fridge.pk}),
+                        ('api_shopping_list', {'pk': fridge.pk}),
+                        ('api_recipe_detail', {'pk': recipe.pk, 'fridge_id': fridge.pk})):
+        response = client.get(reverse(url, kwargs=kwargs))
+        async_response = client.get(reverse(f'async_{url}', kwargs=kwargs))
+
+        assert response.status_code == async_response.status_code == 200
+        assert response.json() == async_response.json()
+
+    data = client.get(reverse('async_api_fridge_detail', kwargs={'pk': fridge.pk})).json()
+    assert [product['id'] for product in data['products']['shopping_list']] == list(
+        fridge.get_products_in_shopping_list().order_by('id').values_list('id', flat=True))
+
+    data = client.get(reverse('async_api_shopping_list', kwargs={'pk': fridge.pk})).json()
+    assert len(data['shops']) == fridge.shops.count()
+    for shop in data['shops']:
+        assert set(shop['product_ids']) == set(fridge.get_products_in_shopping_list().filter(
+            Q(shops=shop['id']) | Q(shops=None)).values_list('id', flat=True))
+
+    other_recipe = Recipe.objects.exclude(fridge=fridge).first()
+    assert client.get(reverse('async_api_recipe_detail',
+                              kwargs={'pk': other_recipe.pk, 'fridge_id': fridge.pk})).status_code == 404
+
+
+def test_fridge_data_build_skips_rows_read_after_a_change():
+    # products read before product 2 was added and shops read after shop 11 was deleted
+    rows = {
+        'products': [{'id': 1, 'name': 'mleko', 'category_id': None, 'place': 0, 'quantity': None, 'unit': ''}],
+        'product_shops': [(1, 10), (1, 11), (2, 10)],
+        'shops': [{'id': 10, 'name': 'sklep'}],
+        'categories': [],
+        'aisles': [],
+        'recipes': [],
+    }
+
+    data = FridgeDetailApiView().build(rows)
+    assert data['products']['shopping_list'][0]['shop_ids'] == [10]
+    data = ShoppingListApiView().build(rows)
+    assert data['shops'][0]['product_ids'] == [1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_middlewares_under_asgi(set_up, settings):
+    settings.PROFILING_ENABLED = True
+    settings.METRICS_ENABLED = True
+    user = choice(set_up)
+    fridge = user.fridges.first()
+    async_client = AsyncClient()
+    async_client.force_login(user)
+
+    client = Client()
+    client.force_login(user)
+
+    response = async_to_sync(async_client.get)(reverse('async_api_fridge_detail', kwargs={'pk': fridge.pk}))
+    cache.clear()
+    caches['fridge_membership'].clear()
+    sync_response = client.get(reverse('api_fridge_detail', kwargs={'pk': fridge.pk}))
+
+    assert response.status_code == 200
+    # queries run concurrently in threads of the pool are seen too
+    query_count = re.search(r'"(\d+) queries', response['Server-Timing']).group(1)
+    assert query_count == re.search(r'"(\d+) queries', sync_response['Server-Timing']).group(1)
+    values = metrics.collect()
+    assert values[('view_latency_seconds_count', (('view', 'FridgeDetailAsyncApiView'),))] >= 1
+    assert values[('view_queries_sum', (('view', 'FridgeDetailAsyncApiView'),))] == int(query_count)
+
+
+def test_local_broker():
+    broker = LocalBroker()
+    subscription = broker.subscribe('fridge:1')
+    broker.subscribe('fridge:2')
+
+    broker.publish('fridge:1', 'message')
+
+    assert subscription.get(timeout=0) == 'message'
+    assert subscription.get(timeout=0) is None
+    subscription.close()
+    assert not broker.has_subscribers('fridge:1')
+    assert broker.has_subscribers('fridge:2')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_fridge_events_stream(client, set_up, settings):
+    settings.EVENTS_STREAM = True
+    settings.EVENTS_KEEPALIVE = 0.01
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    version = Fridge.objects.get(pk=fridge.pk).version
+
+    response = client.get(reverse('api_fridge_events', kwargs={'pk': fridge.pk}), {'since': version})
+    stream = iter(response.streaming_content)
+
+    assert response['Content-Type'] == 'text/event-stream'
+    # SQLite keeps in-memory test databases open, so only the call is checked
+    with patch.object(connections['default'], 'close', wraps=connections['default'].close) as close:
+        assert next(stream).decode() == f'id: {version}\nevent: version\ndata: {{"version": {version}}}\n\n'
+    close.assert_called_once_with()
+    assert next(stream) == b': keepalive\n\n'
+
+    products = list(fridge.get_products_in_shopping_list()[:2])
+    Product.move_to_place(fridge.pk, [product.pk for product in products], 1)
+    event = next(stream).decode()
+
+    assert event.startswith(f'id: {version + 1}\nevent: products\n')
+    data = json.loads(event.split('data: ', 1)[1])
+    assert sorted(product['id'] for product in data['changed']) == sorted(product.pk for product in products)
+    assert all(product['place'] == 1 for product in data['changed'])
+
+    product_id = products[0].pk
+    products[0].delete()
+    data = json.loads(next(stream).decode().split('data: ', 1)[1])
+    assert data['deleted'] == [product_id]
+
+    response.close()
+    assert not events.has_subscribers(fridge.pk)
+
+
+@pytest.mark.django_db
+def test_fridge_events_stream_resync(client, set_up, settings):
+    settings.EVENTS_STREAM = True
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    Fridge.objects.filter(pk=fridge.pk).update(version=5)
+
+    response = client.get(reverse('api_fridge_events', kwargs={'pk': fridge.pk}), HTTP_LAST_EVENT_ID='3')
+
+    assert next(iter(response.streaming_content)).startswith(b'id: 5\nevent: resync\n')
+    response.close()
+
+
+@pytest.mark.django_db
+def test_fridge_events_stream_is_opt_in(client, set_up, settings):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    url = reverse('api_fridge_events', kwargs={'pk': fridge.pk})
+
+    assert client.get(url).status_code == 404
+    html = client.get(reverse('fridge_detail', kwargs={'pk': fridge.pk})).content.decode()
+    assert f'data-changes-url="{reverse("api_change_list", kwargs={"pk": fridge.pk})}"' in html
+    assert 'data-events-url' not in html
+
+    settings.EVENTS_STREAM = True
+    # closed without being iterated, e.g. after the client disconnected
+    client.get(url).close()
+    assert not events.has_subscribers(fridge.pk)
+
+
+def test_bundle_encoding():
+    assert delta_encode([125, 120, 121]) == [120, 1, 4]
+    assert delta_decode([120, 1, 4]) == [120, 121, 125]
+    assert delta_decode(delta_encode([])) == []
+    with pytest.raises(ValueError):
+        delta_decode([120, -1])
+
+    strings = StringTable()
+    assert [strings('kg'), strings('l'), strings('kg')] == [0, 1, 0]
+    assert strings.strings == ['kg', 'l']
+
+
+@pytest.mark.django_db
+def test_api_shopping_list_bundle(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    url = reverse('api_shopping_list_bundle', kwargs={'pk': fridge.pk})
+
+    response = client.get(url)
+    bundle = response.json()
+    strings = bundle['strings']
+    products = bundle['products']
+    category_ids = delta_decode(bundle['categories']['ids'])
+    shop_ids = delta_decode(bundle['shops']['ids'])
+
+    assert bundle['version'] == Fridge.objects.get(pk=fridge.pk).version
+    expected = fridge.get_products_in_shopping_list().order_by('id')
+    assert delta_decode(products['ids']) == [product.id for product in expected]
+    for i, product in enumerate(expected):
+        assert strings[products['names'][i]] == product.name
+        assert strings[products['units'][i]] == product.unit
+        assert products['quantities'][i] == product.quantity
+        category = products['categories'][i]
+        assert (category_ids[category] if category != -1 else None) == product.category_id
+    product_ids = delta_decode(products['ids'])
+    for shop_id, product_indexes in zip(shop_ids, bundle['shops']['products']):
+        assert {product_ids[index] for index in product_indexes} == set(expected.filter(
+            Q(shops=shop_id) | Q(shops=None)).values_list('id', flat=True))
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    assert client.get(url, HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'] == 'gzip'
+
+
+@pytest.mark.django_db
+def test_api_commit_purchases(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    url = reverse('api_commit_purchases', kwargs={'pk': fridge.pk})
+    product_ids = list(fridge.get_products_in_shopping_list().values_list('id', flat=True)[:3])
+    other_fridge_product = Product.objects.exclude(fridge=fridge).filter(place=0).first()
+    bought_at = timezone.now() - timedelta(hours=2)
+    payload = {'product_ids': delta_encode(product_ids + [other_fridge_product.id]), 'bought_at': bought_at.isoformat()}
+
+    response = client.post(url, json.dumps(payload), content_type='application/json')
+
+    assert response.json() == {'moved': len(product_ids), 'version': Fridge.objects.get(pk=fridge.pk).version}
+    assert set(fridge.get_products_in_fridge().filter(last_bought=bought_at).values_list('id', flat=True)) == \
+           set(product_ids)
+    assert Product.objects.get(pk=other_fridge_product.pk).place == 0
+
+    response = client.post(url, json.dumps(payload), content_type='application/json')
+    assert response.json()['moved'] == 0
+
+    response = client.post(url, json.dumps({'product_ids': 'abc'}), content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_api_commit_purchases_rejects_future_time(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    product = fridge.get_products_in_shopping_list().first()
+    payload = {'product_ids': delta_encode([product.id]), 'bought_at': (timezone.now() + timedelta(days=1)).isoformat()}
+
+    response = client.post(reverse('api_commit_purchases', kwargs={'pk': fridge.pk}), json.dumps(payload),
+                           content_type='application/json')
+
+    assert response.status_code == 400
+    assert Product.objects.get(pk=product.pk).place == 0
+
+
+@pytest.mark.django_db
+def test_stale_purchase_keeps_statistics(set_up):
+    fridge = Fridge.objects.first()
+    product = fridge.products.first()
+    last_bought = timezone.now() - timedelta(days=1)
+    Product.objects.filter(pk=product.pk).update(place=0, last_bought=last_bought, avg_time_between_purchases=3600,
+                                                 next_purchase=last_bought + timedelta(hours=1))
+
+    assert Product.move_to_place(fridge.id, [product.id], 1, bought_at=last_bought - timedelta(days=5)) == 1
+
+    product = Product.objects.get(pk=product.pk)
+    assert product.place == 1
+    assert product.last_bought == last_bought
+    assert product.avg_time_between_purchases == 3600
+    assert product.next_purchase == last_bought + timedelta(hours=1)
+    assert product.purchases.count() == 1
+
+
+@pytest.mark.django_db
+def test_fridge_product_count(set_up):
+    fridge = Fridge.objects.first()
+    count = fridge.products.count()
+    assert Fridge.objects.get(pk=fridge.pk).product_count == count
+
+    product = Product.objects.create(name='counted product', fridge=fridge)
+    assert Fridge.objects.get(pk=fridge.pk).product_count == count + 1
+
+    product.delete()
+    fridge.products.first().delete()
+    assert Fridge.objects.get(pk=fridge.pk).product_count == count - 1
+
+    Fridge.objects.update(product_count=0)
+    Fridge.update_product_counts(Fridge.objects.values_list('pk', flat=True))
+    for fridge in Fridge.objects.all():
+        assert fridge.product_count == fridge.products.count()
+
+
+@pytest.mark.django_db
+def test_main_redirects_to_last_used_fridge(client, set_up):
+    user = login(client, choice(set_up))
+    fridges = list(user.fridges.all())
+    Product.objects.create(name='one more product', fridge=fridges[1])
+
+    response = client.get(reverse('main'))
+    assert response.url == reverse('fridge_detail', kwargs={'pk': fridges[1].pk})
+
+    client.get(reverse('fridge_detail', kwargs={'pk': fridges[0].pk}))
+    response = client.get(reverse('main'))
+    assert response.url == reverse('fridge_detail', kwargs={'pk': fridges[0].pk})
+
+    fridges[0].users.remove(user)
+    response = client.get(reverse('main'))
+    assert response.url == reverse('fridge_detail', kwargs={'pk': fridges[1].pk})
+
+
+@pytest.mark.django_db
+def test_shop_router(set_up):
+    fridge = Fridge.objects.first()
+    categories = list(fridge.categories.order_by('id'))
+    shops = list(fridge.shops.order_by('id'))
+    products = [Product(id=i, name=str(i), category=category) for i, category in
+                enumerate(categories + [None] + categories, start=1)]
+    shop_ids_by_product = {1: {shops[0].id}, 2: {shops[1].id}}
+    router = ShopRouter(shops, categories, [(shops[1].id, categories[1].id, 1)])
+
+    products_by_shop = router.route(products, shop_ids_by_product)
+
+    assert router.get_categories(shops[0].id) == categories
+    assert router.get_categories(shops[1].id) == [categories[1], categories[0]]
+    assert [product.id for product in products_by_shop[shops[0].id]] == [1, 4, 5, 3]
+    assert [product.id for product in products_by_shop[shops[1].id]] == [2, 5, 4, 3]
+
+
+@pytest.mark.django_db
+def test_shopping_lists_of_shops_follow_aisles_everywhere(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    shop = fridge.shops.first()
+    categories = list(fridge.categories.order_by('id'))
+    ShopAisle.set_order(shop, {category.id: position for position, category in enumerate(reversed(categories))})
+    fridge.products.update(place=0)
+    # products of the set up get random categories, the last one needs at least two of them
+    fridge.products.filter(pk__in=list(fridge.products.order_by('id').values_list('id', flat=True)[:2])).update(
+        category=categories[-1])
+    expected = [product.id for product in FridgeSnapshot(fridge).products_by_shop[shop.id]]
+
+    data = client.get(reverse('api_shopping_list', kwargs={'pk': fridge.pk})).json()
+    bundle = client.get(reverse('api_shopping_list_bundle', kwargs={'pk': fridge.pk})).json()
+
+    assert [Product.objects.get(pk=product_id).category_id for product_id in expected[:2]] == \
+           [categories[-1].id] * 2
+    assert next(row for row in data['shops'] if row['id'] == shop.id)['product_ids'] == expected
+    product_ids = delta_decode(bundle['products']['ids'])
+    shop_index = delta_decode(bundle['shops']['ids']).index(shop.id)
+    assert [product_ids[index] for index in bundle['shops']['products'][shop_index]] == expected
+
+
+@pytest.mark.django_db
+def test_shop_update_sets_aisle_order(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    shop = fridge.shops.first()
+    first, second = fridge.categories.order_by('id')[:2]
+    version = Fridge.objects.get(pk=fridge.pk).version
+
+    response = client.post(shop.get_update_url(), {'name': shop.name, f'aisle_{second.id}': 1, f'aisle_{first.id}': 2})
+
+    assert response.status_code == 302
+    assert dict(shop.aisles.values_list('category_id', 'position')) == {second.id: 1, first.id: 2}
+    assert Fridge.objects.get(pk=fridge.pk).version > version
+    assert FridgeSnapshot(fridge).get_categories(shop.id)[:2] == [second, first]
+
+
+def test_parse_receipt():
+    rows = list(parse_receipt(['Mleko 2 l 5,98', '', 'Chleb żytni 4.50 zł', 'Ser 0,25 kg']))
+
+    assert [(row.line_number, row.name, row.quantity, row.unit) for row in rows] == [
+        (1, 'Mleko', 2, 'l'),
+        (3, 'Chleb żytni', None, ''),
+        (4, 'Ser', 0.25, 'kg'),
+    ]
+
+
+@pytest.mark.django_db
+def test_product_import(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    existing = fridge.products.first()
+    version = Fridge.objects.get(pk=fridge.pk).version
+    content = (
+        'name,quantity,unit,category,shops\n'
+        f'{existing.name},1,,,\n'
+        'Jogurt,2,szt,Nabiał,Biedronka;Lidl\n'
+        'Jogurt,3,szt,,\n'
+        f'{"x" * 65},,,,\n'
+        'Sól,,,Przyprawy,\n'
+    )
+
+    response = client.post(reverse('product_import', kwargs={'pk': fridge.pk}),
+                           {'file': SimpleUploadedFile('products.csv', content.encode()), 'format': 'csv', 'place': 0},
+                           follow=True)
+
+    assert response.request['PATH_INFO'] == reverse('fridge_detail', kwargs={'pk': fridge.pk})
+    yogurt = Product.objects.get(fridge=fridge, name='Jogurt')
+    assert (yogurt.quantity, yogurt.unit, yogurt.place, yogurt.category.name) == (2, 'szt', 0, 'Nabiał')
+    assert set(yogurt.shops.values_list('name', flat=True)) == {'Biedronka', 'Lidl'}
+    assert Product.objects.get(fridge=fridge, name='Sól').category.name == 'Przyprawy'
+    fridge = Fridge.objects.get(pk=fridge.pk)
+    assert fridge.product_count == fridge.products.count()
+    assert fridge.version > version
+    assert [product.name for product in Product.search(fridge.pk, 'jogurt')] == ['Jogurt']
+
+
+@pytest.mark.django_db
+def test_import_products_command(set_up, tmp_path):
+    fridge = Fridge.objects.first()
+    products_before = fridge.products.count()
+    path = tmp_path / 'receipt.txt'
+    path.write_text('\n'.join(f'Produkt {i} 1 szt 2,99' for i in range(25)), encoding='utf-8')
+    out = StringIO()
+
+    call_command('import_products', fridge.pk, str(path), format='receipt', batch_size=10, stdout=out)
+
+    assert fridge.products.count() == products_before + 25
+    assert 'dodano: 25' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_fridge_export_jsonl(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    product = fridge.products.first()
+    product.shops.set(fridge.shops.all())
+
+    response = client.get(reverse('fridge_export', kwargs={'pk': fridge.pk}), {'format': 'jsonl'})
+
+    assert response.streaming
+    records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert records[0] == {'type': 'fridge', 'id': fridge.pk, 'name': fridge.name,
+                          'version': Fridge.objects.get(pk=fridge.pk).version}
+    counts = {}
+    for record in records:
+        counts[record['type']] = counts.get(record['type'], 0) + 1
+    assert counts.get('category', 0) == fridge.categories.count()
+    assert counts.get('shop', 0) == fridge.shops.count()
+    assert counts.get('product', 0) == fridge.products.count()
+    assert counts.get('recipe', 0) == fridge.recipes.count()
+    assert counts.get('product_in_recipe', 0) == ProductInRecipe.objects.filter(recipe__fridge=fridge).count()
+    exported = next(record for record in records if record['type'] == 'product' and record['id'] == product.pk)
+    assert exported['shop_ids'] == sorted(fridge.shops.values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+def test_fridge_export_csv(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+
+    response = client.get(reverse('fridge_export', kwargs={'pk': fridge.pk}), {'format': 'csv'})
+
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[0].startswith('type,id,name,')
+    assert len(lines) == 2 + fridge.categories.count() + fridge.shops.count() + fridge.products.count() + \
+        fridge.recipes.count() + ProductInRecipe.objects.filter(recipe__fridge=fridge).count()
+    assert client.get(reverse('fridge_export', kwargs={'pk': fridge.pk}), {'format': 'xml'}).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_export_records_are_read_in_one_transaction(set_up):
+    fridge = Fridge.objects.first()
+    records = export_records(fridge.pk)
+
+    assert all(connection.in_atomic_block for _ in records)
+    assert not connection.in_atomic_block
+
+
+@pytest.mark.django_db
+def test_export_fridges_command(set_up, tmp_path):
+    call_command('export_fridges', str(tmp_path), workers=1, stdout=StringIO())
+
+    for fridge in Fridge.objects.all():
+        with gzip.open(tmp_path / f'fridge_{fridge.pk}.jsonl.gz', 'rt', encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        assert records[0]['id'] == fridge.pk
+        assert sum(record['type'] == 'product' for record in records) == fridge.products.count()
+
+
+def fridge_contents(fridge):
+    return {
+        'categories': set(fridge.categories.values_list('name', flat=True)),
+        'shops': set(fridge.shops.values_list('name', flat=True)),
+        'products': set(fridge.products.values_list('name', 'category__name', 'place', 'unit', 'quantity')),
+        'product_shops': set(Product.shops.through.objects.filter(product__fridge=fridge).values_list(
+            'product__name', 'shop__name')),
+        'recipes': set(fridge.recipes.values_list('name', 'owner_id')),
+        'products_in_recipes': set(ProductInRecipe.objects.filter(recipe__fridge=fridge).values_list(
+            'recipe__name', 'product__name', 'quantity_in_recipe')),
+    }
+
+
+@pytest.mark.django_db
+def test_fridge_clone(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = user.fridges.first()
+    product = fridge.products.first()
+    product.shops.set(fridge.shops.all())
+
+    response = client.post(reverse('fridge_clone', kwargs={'pk': fridge.pk}), {'name': 'clone'})
+
+    clone = Fridge.objects.get(name='clone')
+    assert response.url == reverse('fridge_detail', kwargs={'pk': clone.pk})
+    assert list(clone.users.all()) == [user]
+    assert fridge_contents(clone) == fridge_contents(fridge)
+    assert clone.product_count == fridge.products.count()
+    assert [found.name for found in Product.search(clone.pk, product.name)][:1] == [product.name]
+
+
+@pytest.mark.django_db
+def test_fridge_merge_resolves_name_conflicts(set_up):
+    # fridges of set_up have objects with the same names
+    source, target = Fridge.objects.all()[:2]
+    category = Category.objects.create(name='source category', fridge=source)
+    new_product = Product.objects.create(name='source product', fridge=source, category=category, quantity=2)
+    new_product.shops.set(source.shops.all())
+    recipe = Recipe.objects.create(name='source recipe', fridge=source, owner=source.users.first())
+    ProductInRecipe.objects.create(recipe=recipe, product=new_product, quantity_in_recipe=1)
+    source_product = source.products.get(name='0')
+    source_product.shops.set(source.shops.all())
+    target_product = target.products.get(name='0')
+    target_category = target_product.category
+    target_recipe_products = fridge_contents(target)['products_in_recipes']
+    expected = fridge_contents(source)
+
+    id_maps = merge_fridges(source, target)
+
+    contents = fridge_contents(target)
+    assert contents['categories'] == expected['categories']
+    assert contents['shops'] == expected['shops']
+    assert {name for name, *_ in contents['products']} == {name for name, *_ in expected['products']}
+    assert target.categories.count() == source.categories.count()
+    assert id_maps[Product][source_product.pk] == target_product.pk
+    assert Product.objects.get(pk=target_product.pk).category == target_category
+    assert set(target_product.shops.values_list('name', flat=True)) == expected['shops']
+    copy = target.products.get(name='source product')
+    assert (copy.category.name, copy.quantity, set(copy.shops.values_list('name', flat=True))) == \
+        ('source category', 2, expected['shops'])
+    assert contents['products_in_recipes'] == target_recipe_products | {('source recipe', 'source product', 1)}
+    assert set(source.users.all()) <= set(target.users.all())
+    assert Fridge.objects.get(pk=target.pk).product_count == target.products.count()
+
+
+@pytest.mark.django_db
+def test_fridge_merge_view(client, set_up):
+    user = login(client, choice(set_up))
+    source, target = user.fridges.all()[:2]
+    source_products = set(source.products.values_list('name', flat=True))
+
+    response = client.post(reverse('fridge_merge', kwargs={'pk': source.pk}),
+                           {'target': target.pk, 'delete_source': 'on'})
+
+    assert response.url == reverse('fridge_detail', kwargs={'pk': target.pk})
+    assert not Fridge.objects.filter(pk=source.pk).exists()
+    assert source_products <= set(target.products.values_list('name', flat=True))
+
+
+def test_recipe_index_rank():
+    index = RecipeIndex()
+    index.update([(1, 10, 2), (1, 11, None), (2, 10, 1), (2, 12, 1), (3, 12, 1), (4, 11, 1), (4, 11, 2)])
+
+    assert index.products == {10: {1, 2}, 11: {1, 4}, 12: {2, 3}}
+    assert index.recipes[4] == {11: 3}
+    assert [(recipe_id, coverage, missing) for recipe_id, coverage, _, missing in index.rank({10: 1, 11: None})] == [
+        (4, 1, {}),
+        (1, 1, {10: 1}),
+        (2, 0.5, {12: 1}),
+    ]
+
+    index.update([(2, 12, 1)], [1, 2])
+    assert index.products == {11: {4}, 12: {2, 3}}
+    assert 1 not in index.recipes
+
+
+@pytest.mark.django_db
+def test_api_recipe_suggestions(client, set_up):
+    user = login(client, choice(set_up))
+    fridge = Fridge.objects.create(name='suggestions')
+    fridge.users.add(user)
+    milk, eggs, flour, salt = [Product.objects.create(name=name, fridge=fridge, place=place, quantity=quantity)
+                               for name, place, quantity in (('mleko', 1, 1), ('jajka', 1, 6),
+                                                             ('mąka', 0, None), ('sól', 1, None))]
+    pancakes = Recipe.objects.create(name='naleśniki', fridge=fridge, owner=user)
+    omelette = Recipe.objects.create(name='omlet', fridge=fridge, owner=user)
+    Recipe.objects.create(name='chleb', fridge=fridge, owner=user).products.add(flour)
+    for recipe, product, quantity in ((pancakes, milk, 2), (pancakes, eggs, 2), (pancakes, flour, 1),
+                                      (omelette, eggs, 3), (omelette, salt, None)):
+        ProductInRecipe.objects.create(recipe=recipe, product=product, quantity_in_recipe=quantity)
+    url = reverse('api_recipe_suggestions', kwargs={'pk': fridge.pk})
+
+    results = client.get(url).json()['results']
+
+    assert [result['name'] for result in results] == ['omlet', 'naleśniki']
+    assert results[0]['missing'] == []
+    assert results[1]['coverage'] == 0.667
+    assert results[1]['missing'] == [{'id': milk.pk, 'name': 'mleko', 'unit': '', 'quantity': 1.0},
+                                     {'id': flour.pk, 'name': 'mąka', 'unit': '', 'quantity': 1.0}]
+    assert results[1]['url'] == pancakes.get_detail_url()
+
+    # every change of products of recipes gets a new index
+    ProductInRecipe.objects.filter(recipe=omelette, product=salt).delete()
+    ProductInRecipe.objects.create(recipe=omelette, product=milk, quantity_in_recipe=5)
+    pancakes.delete()
+    index = get_recipe_index(fridge.pk)
+    assert index.recipes[omelette.pk] == {eggs.pk: 3, milk.pk: 5}
+    assert pancakes.pk not in index.recipes
+
+    # other changes of the fridge keep it
+    Product.move_to_place(fridge.pk, [milk.pk], 0)
+    Product.move_to_place(fridge.pk, [milk.pk], 1)
+    with CaptureQueriesContext(connection) as queries:
+        get_recipe_index(fridge.pk)
+    assert not any('shopping_lists_productinrecipe' in query['sql'] for query in queries.captured_queries)
+
+    bread = Recipe.objects.get(fridge=fridge, name='chleb')
+    bread.products.add(salt)
+    assert get_recipe_index(fridge.pk).recipes[bread.pk] == {flour.pk: None, salt.pk: None}
+    bread.products.remove(salt)
+    assert get_recipe_index(fridge.pk).recipes[bread.pk] == {flour.pk: None}
+    assert [result['missing'] for result in client.get(url).json()['results']] == [
+        [{'id': milk.pk, 'name': 'mleko', 'unit': '', 'quantity': 4.0}]]
+    assert client.get(url, {'limit': 'x'}).status_code == 400
+
+    stale_index = RecipeIndex()
+    stale_index.update([(omelette.pk, eggs.pk, 3), (omelette.pk, 0, 1)])
+    with patch('shopping_lists.suggestions.get_recipe_index', return_value=stale_index):
+        response = client.get(url)
+    assert response.status_code == 200
+    assert response.json()['results'][0]['missing'] == []
@@ -15,7 +15,7 @@ Including another URLconf
 """
 from django.urls import path
 
-from shopping_lists import views
+from shopping_lists import views, api, metrics
 
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
@@ -27,6 +27,9 @@ urlpatterns = [
     path('fridges/<int:pk>/', views.FridgeDetailView.as_view(), name='fridge_detail'),
     path('fridges/<int:pk>/update/', views.FridgeUpdateView.as_view(), name='fridge_update'),
     path('fridges/<int:pk>/delete/', views.FridgeDeleteView.as_view(), name='fridge_delete'),
+    path('fridges/<int:pk>/clone/', views.FridgeCloneView.as_view(), name='fridge_clone'),
+    path('fridges/<int:pk>/merge/', views.FridgeMergeView.as_view(), name='fridge_merge'),
+    path('fridges/<int:pk>/export/', views.FridgeExportView.as_view(), name='fridge_export'),
 
     path('fridges/<int:pk>/category/create/', views.CategoryCreateView.as_view(), name='category_create'),
     path('fridges/<int:fridge_id>/category/<int:pk>/update/', views.CategoryUpdateView.as_view(),
@@ -39,6 +42,7 @@ urlpatterns = [
     path('fridges/<int:fridge_id>/shop/<int:pk>/delete/', views.ShopDeleteView.as_view(), name='shop_delete'),
 
     path('fridges/<int:pk>/product/create/', views.ProductCreateView.as_view(), name='product_create'),
+    path('fridges/<int:pk>/product/import/', views.ProductImportView.as_view(), name='product_import'),
     path('fridges/<int:fridge_id>/product/<int:pk>/update/', views.ProductUpdateView.as_view(), name='product_update'),
     path('fridges/<int:fridge_id>/product/<int:pk>/delete/', views.ProductDeleteView.as_view(), name='product_delete'),
 
@@ -52,6 +56,8 @@ urlpatterns = [
     path('fridges/<int:fridge_id>/recipe/<int:pk>/delete/', views.RecipeDeleteView.as_view(), name='recipe_delete'),
     path('fridges/<int:fridge_id>/recipe/<int:pk>/add-to-shopping-list/', views.AddRecipeToShoppingListView.as_view(),
          name='add_recipe_to_shopping_list'),
+    path('fridges/<int:pk>/recipes/add-to-shopping-list/', views.AddRecipesToShoppingListView.as_view(),
+         name='add_recipes_to_shopping_list'),
 
     path('my-recipes/', views.UserRecipeListView.as_view(), name='recipe_list'),
 
@@ -66,4 +72,33 @@ urlpatterns = [
     path('invitation/<slug:slug>/', views.InvitationAcceptView.as_view(), name='invitation_accept'),
     path('fridges/<int:fridge_id>/invitation/<int:pk>/', views.InvitationShowView.as_view(), name='invitation_show'),
 
+    path('profiling/', views.ProfilingPanelView.as_view(), name='profiling_panel'),
+    path('metrics', metrics.MetricsView.as_view(), name='metrics'),
+
+    path('api/fridges/', api.FridgeListApiView.as_view(), name='api_fridge_list'),
+    path('api/fridges/<int:pk>/products/', api.ProductListApiView.as_view(), name='api_product_list'),
+    path('api/fridges/<int:pk>/products/search/', api.ProductSearchApiView.as_view(), name='api_product_search'),
+    path('api/fridges/<int:pk>/categories/', api.CategoryListApiView.as_view(), name='api_category_list'),
+    path('api/fridges/<int:pk>/shops/', api.ShopListApiView.as_view(), name='api_shop_list'),
+    path('api/fridges/<int:pk>/recipes/', api.RecipeListApiView.as_view(), name='api_recipe_list'),
+    path('api/fridges/<int:pk>/recipes/suggestions/', api.RecipeSuggestionsApiView.as_view(),
+         name='api_recipe_suggestions'),
+    path('api/fridges/<int:pk>/changes/', api.ChangeListApiView.as_view(), name='api_change_list'),
+
+    path('api/fridges/<int:pk>/shopping-list/bundle/', api.ShoppingListBundleApiView.as_view(),
+         name='api_shopping_list_bundle'),
+    path('api/fridges/<int:pk>/shopping-list/purchases/', api.CommitPurchasesApiView.as_view(),
+         name='api_commit_purchases'),
+    path('api/fridges/<int:pk>/events/', api.FridgeEventsView.as_view(), name='api_fridge_events'),
+    path('api/fridges/<int:pk>/detail/', api.FridgeDetailApiView.as_view(), name='api_fridge_detail'),
+    path('api/fridges/<int:pk>/shopping-list/', api.ShoppingListApiView.as_view(), name='api_shopping_list'),
+    path('api/fridges/<int:fridge_id>/recipes/<int:pk>/', api.RecipeDetailApiView.as_view(),
+         name='api_recipe_detail'),
+    path('async/api/fridges/<int:pk>/detail/', api.FridgeDetailAsyncApiView.as_view(),
+         name='async_api_fridge_detail'),
+    path('async/api/fridges/<int:pk>/shopping-list/', api.ShoppingListAsyncApiView.as_view(),
+         name='async_api_shopping_list'),
+    path('async/api/fridges/<int:fridge_id>/recipes/<int:pk>/', api.RecipeDetailAsyncApiView.as_view(),
+         name='async_api_recipe_detail'),
+
 ]
@@ -1,22 +1,32 @@
+import codecs
 from random import choice
 from secrets import token_urlsafe
 
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Count
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, redirect
 
 # Create your views here.
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.views import View
-from django.views.generic import CreateView, ListView, DetailView, DeleteView, UpdateView
+from django.views.generic import CreateView, ListView, DetailView, DeleteView, UpdateView, TemplateView, FormView
 
 from shopping_lists.forms import FridgeModelForm, CategoryModelForm, ShopModelForm, ProductModelForm, RecipeModelForm, \
-    ProductInRecipeModelForm
+    ProductInRecipeModelForm, RecipesToShoppingListForm, ProductImportForm, FridgeMergeForm
+from shopping_lists.cloning import clone_fridge, merge_fridges
+from shopping_lists.exporting import EXPORTERS
+from shopping_lists.importing import PARSERS, import_products
+from shopping_lists.membership import is_fridge_member
 from shopping_lists.mixins import UserHasAccessToFridgeMixin
 from shopping_lists.models import Fridge, Category, Shop, Product, Recipe, ProductInRecipe, Invitation
+from shopping_lists.profiling import get_profiling_summary
+from shopping_lists.shopping_list import add_recipes_to_shopping_list
+from shopping_lists.snapshot import FridgeSnapshot
 
 
 class IndexView(View):
@@ -34,10 +44,13 @@ class SingUpView(CreateView):
 
 class MainView(LoginRequiredMixin, View):
     def get(self, request):
-        if request.user.fridges.all().count() > 0:
-            return redirect(reverse_lazy('fridge_detail', kwargs={'pk': request.user.fridges.all().
-                                         annotate(num_products=Count('products')).
-                                         order_by('-num_products').first().pk}))
+        # the fridge used last time, otherwise the one with the most products
+        fridge_id = request.session.get('last_fridge_id')
+        if fridge_id is None or not is_fridge_member(request.user.id, fridge_id):
+            fridge_id = request.user.fridges.order_by('-product_count', 'id').values_list('id', flat=True).first()
+
+        if fridge_id is not None:
+            return redirect(reverse_lazy('fridge_detail', kwargs={'pk': fridge_id}))
         else:
             return redirect(reverse_lazy('fridge_create'))
 
@@ -80,25 +93,90 @@ class FridgeDeleteView(UserHasAccessToFridgeMixin, DeleteView):
 class FridgeDetailView(UserHasAccessToFridgeMixin, DetailView):
     model = Fridge
 
+    def get(self, request, *args, **kwargs):
+        if request.session.get('last_fridge_id') != self.kwargs['pk']:
+            request.session['last_fridge_id'] = self.kwargs['pk']
+        return super().get(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product_form = ProductModelForm(fridge_id=self.kwargs['pk'])
-        category_form = CategoryModelForm(fridge_id=self.kwargs['pk'])
-        shop_form = ShopModelForm(fridge_id=self.kwargs['pk'])
-        recipe_form = RecipeModelForm(fridge_id=self.kwargs['pk'], user=self.request.user)
-
-        context.update({'product_form': product_form,
+        product_form = ProductModelForm(fridge=self.object)
+        category_form = CategoryModelForm(fridge=self.object)
+        shop_form = ShopModelForm(fridge=self.object)
+        recipe_form = RecipeModelForm(fridge=self.object, user=self.request.user)
+
+        context.update({'snapshot': FridgeSnapshot(self.object),
+                        'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+                        # products become due with time, not only with changes of the fridge
+                        'due_soon_cache_key': timezone.now().strftime('%Y%m%d%H'),
+                        'events_stream': settings.EVENTS_STREAM,
+                        'events_poll_interval': settings.EVENTS_POLL_INTERVAL,
+                        'product_form': product_form,
                         'category_form': category_form,
                         'shop_form': shop_form,
                         'recipe_form': recipe_form,
+                        'recipes_to_shopping_list_form': RecipesToShoppingListForm(fridge_id=self.object.pk),
                         'product_action': reverse_lazy('product_create', kwargs={'pk': self.kwargs['pk']}),
                         'category_action': reverse_lazy('category_create', kwargs={'pk': self.kwargs['pk']}),
                         'shop_action': reverse_lazy('shop_create', kwargs={'pk': self.kwargs['pk']}),
                         'recipe_action': reverse_lazy('recipe_create', kwargs={'pk': self.kwargs['pk']}),
+                        'recipes_to_shopping_list_action': reverse_lazy('add_recipes_to_shopping_list',
+                                                                        kwargs={'pk': self.kwargs['pk']}),
                         })
         return context
 
 
+class FridgeCloneView(UserHasAccessToFridgeMixin, FormView):
+    form_class = FridgeModelForm
+    template_name = 'shopping_lists/fridge_clone_form.html'
+
+    def get_initial(self):
+        fridge = Fridge.objects.get(pk=self.kwargs['pk'])
+        return {'name': f'{fridge.name} (kopia)'[:Fridge._meta.get_field('name').max_length]}
+
+    def form_valid(self, form):
+        self.object = clone_fridge(Fridge.objects.get(pk=self.kwargs['pk']), [self.request.user],
+                                   name=form.cleaned_data['name'])
+        messages.success(self.request, f'Utworzono kopię lodówki: {self.object}')
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse_lazy('fridge_detail', kwargs={'pk': self.object.pk})
+
+
+class FridgeMergeView(UserHasAccessToFridgeMixin, FormView):
+    form_class = FridgeMergeForm
+    template_name = 'shopping_lists/fridge_merge_form.html'
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs.update(user=self.request.user, source_id=self.kwargs['pk'])
+        return kwargs
+
+    def form_valid(self, form):
+        source = Fridge.objects.get(pk=self.kwargs['pk'])
+        self.target = form.cleaned_data['target']
+        merge_fridges(source, self.target)
+        if form.cleaned_data['delete_source']:
+            source.delete()
+        messages.success(self.request, f'Połączono lodówkę {source} z lodówką {self.target}')
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse_lazy('fridge_detail', kwargs={'pk': self.target.pk})
+
+
+class FridgeExportView(UserHasAccessToFridgeMixin, View):
+    def get(self, request, pk):
+        export_format = request.GET.get('format', 'jsonl')
+        if export_format not in EXPORTERS:
+            raise Http404
+        exporter, content_type = EXPORTERS[export_format]
+        response = StreamingHttpResponse(exporter(pk), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="fridge_{pk}.{export_format}"'
+        return response
+
+
 class CategoryCreateView(UserHasAccessToFridgeMixin, CreateView):
     model = Category
 
@@ -189,14 +267,29 @@ class ProductDeleteView(UserHasAccessToFridgeMixin, DeleteView):
         return reverse_lazy('fridge_detail', kwargs={'pk': self.kwargs['fridge_id']})
 
 
+class ProductImportView(UserHasAccessToFridgeMixin, FormView):
+    form_class = ProductImportForm
+    template_name = 'shopping_lists/product_import_form.html'
+
+    def get_success_url(self):
+        return reverse_lazy('fridge_detail', kwargs={'pk': self.kwargs['pk']})
+
+    def form_valid(self, form):
+        lines = codecs.iterdecode(form.cleaned_data['file'], 'utf-8-sig', errors='replace')
+        result = import_products(self.kwargs['pk'], PARSERS[form.cleaned_data['format']](lines),
+                                 place=form.cleaned_data['place'])
+        messages.success(self.request, f'Import produktów: {result}')
+        for line_number, error in result.errors[:10]:
+            messages.warning(self.request, f'Linia {line_number}: {error}')
+        return super().form_valid(form)
+
+
 class ProductsToFridge(UserHasAccessToFridgeMixin, View):
     def post(self, request, pk):
         product_ids = request.POST.getlist('product')
         if product_ids:
-            products = Product.objects.filter(id__in=product_ids)
-            for product in products:
-                product.place = 1
-                product.save()
+            moved = Product.move_to_place(pk, product_ids, 1)
+            messages.success(request, f'Przeniesiono do lodówki produktów: {moved}')
         return redirect(reverse_lazy('fridge_detail', kwargs={'pk': pk}))
 
 
@@ -204,10 +297,8 @@ class ProductsToShoppingList(UserHasAccessToFridgeMixin, View):
     def post(self, request, pk):
         product_ids = request.POST.getlist('product')
         if product_ids:
-            products = Product.objects.filter(id__in=product_ids)
-            for product in products:
-                product.place = 0
-                product.save()
+            moved = Product.move_to_place(pk, product_ids, 0)
+            messages.success(request, f'Wpisano na listę zakupów produktów: {moved}')
         return redirect(reverse_lazy('fridge_detail', kwargs={'pk': pk}))
 
 
@@ -228,7 +319,10 @@ class RecipeDetailView(UserHasAccessToFridgeMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context.update({'form': ProductInRecipeModelForm(recipe=self.object),
+        # the related manager sets recipe of the rows, so their urls don't query it
+        products_in_recipe = list(self.object.productinrecipe_set.select_related('product'))
+        context.update({'products_in_recipe': products_in_recipe,
+                        'form': ProductInRecipeModelForm(recipe=self.object),
                         'action': reverse_lazy('product_in_recipe_create',
                                                kwargs={'pk': self.kwargs['pk'], 'fridge_id': self.kwargs['fridge_id']}
                                                )})
@@ -239,7 +333,7 @@ class RecipeUpdateView(UserHasAccessToFridgeMixin, UpdateView):
     model = Recipe
 
     def get_success_url(self):
-        return reverse_lazy('recipe_detail', kwargs={'pk': self.object.id, 'fridge_id': self.object.fridge.id})
+        return reverse_lazy('recipe_detail', kwargs={'pk': self.object.id, 'fridge_id': self.object.fridge_id})
 
     def get_form(self):
         return RecipeModelForm(fridge_id=self.kwargs['fridge_id'],
@@ -259,7 +353,7 @@ class UserRecipeListView(LoginRequiredMixin, ListView):
     model = Recipe
 
     def get_queryset(self):
-        return self.request.user.recipes.all()
+        return self.request.user.recipes.select_related('fridge')
 
 
 class ProductInRecipeCreateView(UserHasAccessToFridgeMixin, CreateView):
@@ -276,9 +370,11 @@ class ProductInRecipeCreateView(UserHasAccessToFridgeMixin, CreateView):
 
 class ProductInRecipeUpdateView(UserHasAccessToFridgeMixin, UpdateView):
     model = ProductInRecipe
+    # urls of the object are built from recipe.fridge_id
+    queryset = ProductInRecipe.objects.select_related('recipe')
 
     def get_success_url(self):
-        return reverse_lazy('recipe_detail', kwargs={'pk': self.object.recipe.pk,
+        return reverse_lazy('recipe_detail', kwargs={'pk': self.object.recipe_id,
                                                      'fridge_id': self.kwargs['fridge_id']})
 
     def get_form(self):
@@ -287,40 +383,40 @@ class ProductInRecipeUpdateView(UserHasAccessToFridgeMixin, UpdateView):
 
 class ProductInRecipeDeleteView(UserHasAccessToFridgeMixin, DeleteView):
     model = ProductInRecipe
+    # urls of the object are built from recipe.fridge_id
+    queryset = ProductInRecipe.objects.select_related('recipe')
     template_name = 'delete_form.html'
 
     def get_success_url(self):
-        return reverse_lazy('recipe_detail', kwargs={'pk': self.object.recipe.pk,
+        return reverse_lazy('recipe_detail', kwargs={'pk': self.object.recipe_id,
                                                      'fridge_id': self.kwargs['fridge_id']})
 
 
 class AddRecipeToShoppingListView(UserHasAccessToFridgeMixin, View):
     def get(self, request, fridge_id, pk):
-        recipe = Recipe.objects.get(pk=pk)
-        for product_in_recipe in recipe.productinrecipe_set.all():
-            product = product_in_recipe.product
-            if product.place == 0:
-                if product_in_recipe.quantity_in_recipe is not None:
-                    if product.quantity is None:
-                        product.quantity = product_in_recipe.quantity_in_recipe
-                    else:
-                        product.quantity += product_in_recipe.quantity_in_recipe
-            else:
-                product.place = 0
-                if product_in_recipe.quantity_in_recipe is not None:
-                    product.quantity = product_in_recipe.quantity_in_recipe
-
-            product.save()
-
+        add_recipes_to_shopping_list(fridge_id, {pk: 1})
         return redirect(reverse_lazy('fridge_detail', kwargs={'pk': fridge_id}))
 
 
+class AddRecipesToShoppingListView(UserHasAccessToFridgeMixin, View):
+    def post(self, request, pk):
+        form = RecipesToShoppingListForm(request.POST, fridge_id=pk)
+        if form.is_valid():
+            servings = form.cleaned_data['servings']
+            updated = add_recipes_to_shopping_list(pk, {recipe.id: servings for recipe in form.cleaned_data['recipes']})
+            messages.success(request, f'Zaktualizowano na liście zakupów produktów: {updated}')
+        else:
+            for error in form.errors.get('servings', []):
+                messages.warning(request, error)
+        return redirect(reverse_lazy('fridge_detail', kwargs={'pk': pk}))
+
+
 class InvitationCreateView(UserHasAccessToFridgeMixin, View):
     def get(self, request, pk):
         fridge = Fridge.objects.get(pk=pk)
 
         unique_slug = token_urlsafe(32)
-        while Invitation.objects.filter(slug=unique_slug).count() != 0:
+        while Invitation.objects.filter(slug=unique_slug).exists():
             unique_slug = token_urlsafe(32)
 
         invitation = Invitation.objects.create(slug=unique_slug, fridge=fridge)
@@ -343,4 +439,16 @@ class InvitationAcceptView(LoginRequiredMixin, View):
         fridge.users.add(request.user)
         invitation.delete()
 
-        return redirect(reverse_lazy('fridge_detail', kwargs={'pk': invitation.fridge.pk}))
+        return redirect(reverse_lazy('fridge_detail', kwargs={'pk': invitation.fridge_id}))
+
+
+class ProfilingPanelView(UserPassesTestMixin, TemplateView):
+    template_name = 'shopping_lists/profiling_panel.html'
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({'summary': get_profiling_summary()})
+        return context
@@ -0,0 +1,130 @@
+document.addEventListener('DOMContentLoaded', () => {
+
+    const container = document.querySelector('[data-version]')
+    if (!container) {
+        return
+    }
+
+    const formatQuantity = product => {
+        if (product.quantity === null) {
+            return ''
+        }
+        return product.unit ? `${product.quantity} ${product.unit}` : `${product.quantity}`
+    }
+
+    const belongsTo = (list, product) => {
+        if (list === 'fridge') {
+            return product.place === 1
+        }
+        if (list === 'shopping_list') {
+            return product.place === 0
+        }
+        if (list === 'due_soon') {
+            // due products are known only to the server, keep the list as it is
+            return null
+        }
+        const shopId = parseInt(list)
+        return product.place === 0 && (product.shop_ids.length === 0 || product.shop_ids.includes(shopId))
+    }
+
+    const createRow = (product, withQuantity) => {
+        const row = document.createElement('div')
+        row.className = 'card col-12 col-sm-6 col-md-4 col-xl-3 d-flex'
+        row.dataset.productId = product.id
+        row.innerHTML = `
+            <div class="form-check">
+                <input type="checkbox" class="form-check-input" value="${product.id}" name="product">
+                <label class="form-check-label" data-product-name></label>
+                ${withQuantity ? '<span class="badge badge-pill badge-warning ml-2" data-product-quantity></span>' : ''}
+            </div>`
+        return row
+    }
+
+    const updateRow = (row, product) => {
+        row.querySelector('[data-product-name]').textContent = product.name
+        const quantity = row.querySelector('[data-product-quantity]')
+        if (quantity) {
+            quantity.textContent = formatQuantity(product)
+            quantity.hidden = product.quantity === null
+        }
+    }
+
+    const addRow = (form, product) => {
+        const list = form.dataset.productList
+        const row = createRow(product, list !== 'fridge')
+        updateRow(row, product)
+        const categoryId = product.category_id === null ? '' : `${product.category_id}`
+        const category = Array.from(form.querySelectorAll('[data-category-id]'))
+            .find(card => card.dataset.categoryId === categoryId)
+        const rows = category ? category.querySelector('.row') : null
+        if (rows) {
+            rows.appendChild(row)
+        } else {
+            // the category isn't shown in this list yet
+            const wrapper = document.createElement('div')
+            wrapper.className = 'container-fluid'
+            wrapper.dataset.categoryId = categoryId
+            wrapper.innerHTML = '<div class="row"></div>'
+            wrapper.firstChild.appendChild(row)
+            form.insertBefore(wrapper, form.querySelector('.card.text-center'))
+        }
+    }
+
+    const applyProducts = data => {
+        for (let form of document.querySelectorAll('form[data-product-list]')) {
+            for (let productId of data.deleted) {
+                form.querySelectorAll(`[data-product-id="${productId}"]`).forEach(row => row.remove())
+            }
+            for (let product of data.changed) {
+                const belongs = belongsTo(form.dataset.productList, product)
+                const row = form.querySelector(`[data-product-id="${product.id}"]`)
+                if (row && belongs === false) {
+                    row.remove()
+                } else if (row) {
+                    updateRow(row, product)
+                } else if (belongs) {
+                    addRow(form, product)
+                }
+            }
+        }
+    }
+
+    if (container.dataset.eventsUrl && window.EventSource) {
+        const events = new EventSource(container.dataset.eventsUrl)
+        events.addEventListener('products', event => applyProducts(JSON.parse(event.data)))
+        // changes were missed while disconnected
+        events.addEventListener('resync', () => window.location.reload())
+        return
+    }
+
+    if (!container.dataset.changesUrl) {
+        return
+    }
+    let version = container.dataset.version
+    let etag = null
+    const poll = () => {
+        // hidden pages are brought up to date once they are shown again
+        if (document.hidden) {
+            return
+        }
+        fetch(`${container.dataset.changesUrl}?since=${version}`, {headers: etag ? {'If-None-Match': etag} : {}})
+            .then(response => {
+                if (response.status !== 200) {
+                    return
+                }
+                etag = response.headers.get('ETag')
+                return response.json().then(data => {
+                    // changes were pruned from the log
+                    if (data.resync) {
+                        window.location.reload()
+                        return
+                    }
+                    applyProducts({changed: data.changed.product, deleted: data.deleted.product})
+                    version = data.version
+                })
+            })
+            .catch(() => null)
+    }
+    setInterval(poll, parseInt(container.dataset.pollInterval) * 1000)
+    document.addEventListener('visibilitychange', poll)
+});
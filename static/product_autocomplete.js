@@ -0,0 +1,32 @@
+document.addEventListener('DOMContentLoaded', () => {
+
+    const inputs = document.querySelectorAll("input[data-autocomplete-url]")
+
+    for (let input of inputs) {
+        const valueInput = input.previousElementSibling
+        const options = document.getElementById(input.getAttribute('list'))
+        let products = []
+
+        const selectProduct = () => {
+            const product = products.find(product => product.name === input.value)
+            valueInput.value = product ? product.id : ''
+        }
+
+        input.addEventListener('input', () => {
+            selectProduct()
+            const url = input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(input.value)
+            fetch(url, {credentials: 'same-origin'})
+                .then(response => response.json())
+                .then(data => {
+                    products = data.results
+                    options.innerHTML = ''
+                    for (let product of products) {
+                        const option = document.createElement('option')
+                        option.value = product.name
+                        options.appendChild(option)
+                    }
+                    selectProduct()
+                })
+        })
+    }
+});